@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from io import BytesIO
+from typing import List, Optional
+from aiohttp import web
+from PIL import Image
+
+SLIDE_COUNT_PATTERN = re.compile(r"Количество слайдов:\s*(\d+)")
+WORD = "текст"
+
+def slide_count_from_prompt(prompt: str, default: int = 5) -> int:
+    match = SLIDE_COUNT_PATTERN.search(prompt)
+    return int(match.group(1)) if match else default
+
+def noise_png(size: int) -> bytes:
+    # Шум почти не сжимается, поэтому размер файла близок к настоящим сгенерированным изображениям
+    img = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    buffer = BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+class FakeBackends:
+    def __init__(self,
+                 llm_latency: float = 0.5,
+                 token_rate: float = 2000.0,
+                 words_per_slide: int = 210,
+                 image_latency: float = 1.0,
+                 image_size: int = 768,
+                 host: str = "127.0.0.1",
+                 port: int = 0):
+        self.llm_latency = llm_latency
+        self.token_rate = token_rate
+        self.words_per_slide = words_per_slide
+        self.image_latency = image_latency
+        self.host = host
+        self.port = port
+        self.image_bytes = noise_png(image_size)
+        self.llm_requests = 0
+        self.image_requests = 0
+        self.__runner: Optional[web.AppRunner] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def llm_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def image_url(self) -> str:
+        return f"{self.base_url}/llm_tools/image_generate"
+
+    def environment(self) -> dict:
+        return {
+            "LLM_HOST": f"http://{self.host}",
+            "LLM_PORT": str(self.port),
+            "IMAGE_API_HOST": f"http://{self.host}",
+            "IMAGE_API_PORT": str(self.port),
+        }
+
+    def slides(self, count: int) -> List[dict]:
+        opisanie = " ".join([WORD] * self.words_per_slide)
+        return [{"zagolovok": f"Слайд {i + 1}", "opisanie": f"{i + 1} {opisanie}"} for i in range(count)]
+
+    def _tokens(self, content: str) -> List[str]:
+        # Один токен — одно слово с пробелом, этого достаточно для оценки скорости генерации
+        return re.findall(r"\S+\s*|\s+", content)
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.llm_requests += 1
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        system_prompt = body["messages"][0]["content"]
+        # Ответ повторяет формат, который просит системный промпт: план, один слайд или список слайдов
+        if "'titles'" in system_prompt:
+            result = {"titles": [slide["zagolovok"] for slide in self.slides(slide_count_from_prompt(prompt))]}
+        elif "an 'opisanie' field" in system_prompt:
+            result = {"opisanie": self.slides(1)[0]["opisanie"]}
+        else:
+            result = self.slides(slide_count_from_prompt(prompt))
+        content = json.dumps(result, ensure_ascii=False)
+        tokens = self._tokens(content)
+        await asyncio.sleep(self.llm_latency)
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        if not body.get("stream"):
+            await asyncio.sleep(len(tokens) / self.token_rate)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens), "total_tokens": len(prompt.split()) + len(tokens)},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        # Токены отправляются пачками раз в 20 мс, чтобы не тратить время на тысячи коротких sleep
+        batch = max(1, int(self.token_rate * 0.02))
+        started = time.perf_counter()
+        for start in range(0, len(tokens), batch):
+            delay = started + start / self.token_rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": "".join(tokens[start:start + batch])}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "fake", "object": "model", "created": 0, "owned_by": "benchmark"}]})
+
+    async def image_generate(self, request: web.Request) -> web.Response:
+        self.image_requests += 1
+        await asyncio.sleep(self.image_latency)
+        return web.Response(text=json.dumps(f"{self.base_url}/images/{uuid.uuid4().hex}.png"))
+
+    async def image_file(self, request: web.Request) -> web.Response:
+        # python-pptx хранит одинаковые изображения один раз; уникальный хвост после IEND
+        # делает каждый файл отдельным, как у настоящего генератора, и не мешает чтению PNG
+        return web.Response(body=self.image_bytes + request.match_info["name"].encode(), content_type="image/png")
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/v1/models", self.models)
+        app.router.add_post("/llm_tools/image_generate", self.image_generate)
+        app.router.add_get("/images/{name}", self.image_file)
+        return app
+
+    async def start(self) -> None:
+        self.__runner = web.AppRunner(self.app(), access_log=None)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, self.host, self.port)
+        await site.start()
+        self.port = self.__runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+            self.__runner = None
+
+    def start_in_thread(self) -> "FakeBackends":
+        # Отдельный цикл событий в потоке: заглушки не конкурируют с измеряемым приложением за его цикл
+        ready = threading.Event()
+
+        def run() -> None:
+            self.__loop = asyncio.new_event_loop()
+            self.__loop.run_until_complete(self.start())
+            ready.set()
+            self.__loop.run_forever()
+            self.__loop.run_until_complete(self.stop())
+            self.__loop.close()
+
+        self.__thread = threading.Thread(target=run, name="fake-backends", daemon=True)
+        self.__thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self) -> None:
+        if self.__loop is not None and self.__thread is not None:
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__thread.join()
+            self.__thread = None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальные заглушки LLM и API изображений")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--token-rate", type=float, default=2000.0)
+    parser.add_argument("--words-per-slide", type=int, default=210)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument("--image-size", type=int, default=768)
+    args = parser.parse_args()
+    fakes = FakeBackends(args.llm_latency, args.token_rate, args.words_per_slide, args.image_latency, args.image_size, args.host, args.port)
+
+    async def serve() -> None:
+        await fakes.start()
+        print(f"Заглушки запущены на {fakes.base_url}")
+        for key, value in fakes.environment().items():
+            print(f"{key}={value}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import httpx
+from benchmarks.fake_backends import FakeBackends
+
+RESULTS_DIR = Path(__file__).parent / "results"
+DEFAULT_SLIDE_COUNTS = [3, 5, 10, 15, 20]
+DEFAULT_CLIENTS = [1, 4, 16]
+# Метрики, по которым сравниваются запуски: для latency/memory/size меньше — лучше, для throughput — больше
+COMPARED = {
+    "latency.p50": False, "latency.p95": False, "latency.p99": False,
+    "throughput_rps": True, "deck_bytes": False, "peak_traced_bytes": False,
+}
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def summarize(latencies: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(latencies),
+        "mean": round(sum(latencies) / len(latencies), 4) if latencies else None,
+        **{f"p{p}": round(percentile(latencies, p), 4) if latencies else None for p in (50, 95, 99)},
+        "max": round(max(latencies), 4) if latencies else None,
+    }
+
+def payload(slide_count: int, args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "topic": "Нагрузочное тестирование",
+        "slide_count": slide_count,
+        "stream_mode": args.stream,
+        "template_mode": args.template,
+        "outline_mode": getattr(args, "outline", False),
+        "use_cache": False,
+    }
+
+async def measure_request(client: httpx.AsyncClient, data: Dict[str, Any], client_id: str = "benchmark") -> Dict[str, Any]:
+    started = time.perf_counter()
+    # Отдельный идентификатор на виртуального клиента, чтобы лимиты планировщика применялись как к разным пользователям
+    # (сервер учитывает его при ADMISSION_TRUST_CLIENT_HEADER=true или за доверенным прокси)
+    response = await client.post("/generate-from-topic/", data={"request": json.dumps(data)}, headers={"X-Client-Id": client_id})
+    seconds = time.perf_counter() - started
+    return {"status": response.status_code, "seconds": seconds, "size": len(response.content), "server_timing": response.headers.get("server-timing")}
+
+async def run_clients(client: httpx.AsyncClient, data: Dict[str, Any], clients: int, requests_per_client: int) -> Dict[str, Any]:
+    # Замкнутая модель: каждый клиент отправляет следующий запрос после получения ответа на предыдущий
+    samples: List[Dict[str, Any]] = []
+
+    async def worker(index: int) -> None:
+        for _ in range(requests_per_client):
+            samples.append(await measure_request(client, data, f"benchmark-{index}"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    ok = [sample for sample in samples if sample["status"] == 200]
+    return {
+        "clients": clients,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency": summarize([sample["seconds"] for sample in ok]),
+    }
+
+async def run_slide_counts(client: httpx.AsyncClient, slide_counts: List[int], args: argparse.Namespace, in_process: bool) -> List[Dict[str, Any]]:
+    results = []
+    for slide_count in slide_counts:
+        if in_process:
+            tracemalloc.start()
+        sample = await measure_request(client, payload(slide_count, args))
+        peak = None
+        if in_process:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results.append({
+            "slide_count": slide_count,
+            "status": sample["status"],
+            "seconds": round(sample["seconds"], 4),
+            "deck_bytes": sample["size"],
+            "peak_traced_bytes": peak,
+            "server_timing": sample["server_timing"],
+        })
+    return results
+
+async def run_suite(client: httpx.AsyncClient, args: argparse.Namespace, in_process: bool) -> Dict[str, Any]:
+    data = payload(args.slide_count, args)
+    # Прогрев: первый запрос создаёт пулы соединений и потоков
+    await measure_request(client, data)
+    latency = await run_clients(client, data, 1, args.requests)
+    throughput = [await run_clients(client, data, clients, args.rounds) for clients in args.clients]
+    slides = await run_slide_counts(client, args.slide_counts, args, in_process)
+    return {"latency": latency, "throughput": throughput, "slides": slides}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    flat = {}
+    for name, value in results["latency"]["latency"].items():
+        if name.startswith("p") and value is not None:
+            flat[f"latency.{name}"] = value
+    for run in results["throughput"]:
+        flat[f"clients={run['clients']}.throughput_rps"] = run["throughput_rps"]
+        for name in ("p50", "p95", "p99"):
+            if run["latency"][name] is not None:
+                flat[f"clients={run['clients']}.latency.{name}"] = run["latency"][name]
+    for run in results["slides"]:
+        for name in ("deck_bytes", "peak_traced_bytes"):
+            if run[name] is not None:
+                flat[f"slides={run['slide_count']}.{name}"] = run[name]
+    return flat
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    lines = []
+    current_flat = flatten(current)
+    baseline_flat = flatten(baseline)
+    for key, value in current_flat.items():
+        old = baseline_flat.get(key)
+        if old is None:
+            continue
+        higher_is_better = next((better for suffix, better in COMPARED.items() if key.endswith(suffix)), False)
+        change = (value - old) / old * 100 if old else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        marker = "хуже" if worse and abs(change) >= 5 else ("лучше" if abs(change) >= 5 else "")
+        lines.append(f"{key:<40} {old:>14} -> {value:>14} {change:+7.1f}% {marker}")
+    return lines
+
+def parse_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк генерации презентаций")
+    parser.add_argument("--url", help="Адрес запущенного сервера; без него приложение запускается в процессе с локальными заглушками")
+    parser.add_argument("--slide-count", type=int, default=10, help="Число слайдов для замеров задержки и пропускной способности")
+    parser.add_argument("--slide-counts", type=parse_list, default=DEFAULT_SLIDE_COUNTS, help="Числа слайдов для замеров памяти и размера (3–20)")
+    parser.add_argument("--clients", type=parse_list, default=DEFAULT_CLIENTS, help="Числа одновременных клиентов")
+    parser.add_argument("--requests", type=int, default=20, help="Число последовательных запросов для замера задержки")
+    parser.add_argument("--rounds", type=int, default=3, help="Число запросов на клиента при замере пропускной способности")
+    parser.add_argument("--stream", action="store_true", help="Потоковый режим LLM")
+    parser.add_argument("--template", action="store_true", help="Шаблонный режим")
+    parser.add_argument("--outline", action="store_true", help="Двухэтапный режим: план и параллельные запросы описаний")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--token-rate", type=float, default=2000.0)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument("--output", type=Path, help="Файл результатов (по умолчанию benchmarks/results/<время>.json)")
+    parser.add_argument("--compare", type=Path, help="Файл результатов предыдущего запуска для сравнения")
+    return parser
+
+async def run_in_process(args: argparse.Namespace) -> Dict[str, Any]:
+    fakes = FakeBackends(llm_latency=args.llm_latency, token_rate=args.token_rate, image_latency=args.image_latency).start_in_thread()
+    # Адреса сервисов читаются при импорте приложения, поэтому окружение задаётся до него
+    os.environ.update(fakes.environment())
+    # Все виртуальные клиенты подключаются из одного процесса, поэтому различаются только заголовком X-Client-Id
+    os.environ.setdefault("ADMISSION_TRUST_CLIENT_HEADER", "true")
+    from generate_presentation import main as app_module
+    try:
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            results = await run_suite(client, args, in_process=True)
+        await app_module.cleanup()
+    finally:
+        fakes.stop_thread()
+    results["backend_requests"] = {"llm": fakes.llm_requests, "image": fakes.image_requests}
+    return results
+
+async def run_remote(args: argparse.Namespace) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        return await run_suite(client, args, in_process=False)
+
+def main() -> None:
+    args = build_parser().parse_args()
+    results = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    results["meta"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "settings": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+    }
+    output = args.output or RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"Задержка (1 клиент): {results['latency']['latency']}")
+    for run in results["throughput"]:
+        print(f"Клиентов: {run['clients']}, запросов/с: {run['throughput_rps']}, ошибок: {run['errors']}, p95: {run['latency']['p95']}")
+    for run in results["slides"]:
+        print(f"Слайдов: {run['slide_count']}, размер: {run['deck_bytes']} байт, пик памяти: {run['peak_traced_bytes']}")
+    print(f"Результаты сохранены в {output}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        print(f"Сравнение с {args.compare}:")
+        for line in compare(results, baseline):
+            print(line)
+    if any(run["errors"] for run in results["throughput"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 from pptx import Presentation
+from io import BytesIO
+from pathlib import Path
 import os
+from generate_presentation.template_registry import TemplateError, TemplateInfo, inspect_template
 
 def check_template(template_path="templates/template.pptx"):
     if not os.path.exists(template_path):
@@ -7,34 +10,28 @@ def check_template(template_path="templates/template.pptx"):
         return
 
     try:
-        prs = Presentation(template_path)
+        data = Path(template_path).read_bytes()
+        prs = Presentation(BytesIO(data))
         print(f"Шаблон загружен: {template_path}")
         print(f"Количество слайдов: {len(prs.slides)}")
 
-        if len(prs.slides) < 2:
-            print("Ошибка: Шаблон должен содержать минимум 2 слайда (титульный и основной)")
+        try:
+            info = inspect_template(prs, TemplateInfo(Path(template_path).stem, Path(template_path), data))
+        except TemplateError as e:
+            print(f"Ошибка: {e}")
             return
 
-        title_slide = prs.slides[0]
-        if title_slide.shapes.title:
+        if info.has_title:
             print("Титульный слайд: Найден плейсхолдер заголовка")
         else:
             print("Предупреждение: На титульном слайде отсутствует плейсхолдер заголовка")
 
-        if len(prs.slides) > 1:
-            content_slide = prs.slides[1]
-            placeholders = [shape for shape in content_slide.shapes if shape.is_placeholder]
-            title_placeholder = any(p.placeholder_format.type == 1 for p in placeholders)  
-            body_placeholder = any(p.placeholder_format.type == 7 for p in placeholders)  
-            picture_placeholder = any(p.placeholder_format.type == 18 for p in placeholders)
-            print("Основной слайд:")
-            print(f"  Плейсхолдер заголовка: {'найден' if title_placeholder else 'не найден'}")
-            print(f"  Плейсхолдер текста: {'найден' if body_placeholder else 'не найден'}")
-            print(f"  Плейсхолдер изображения: {'найден' if picture_placeholder else 'не найден'}")
-        else:
-            print("Ошибка: Основной слайд отсутствует")
+        print("Основной слайд:")
+        print(f"  Плейсхолдер заголовка: {'найден' if info.title_idx is not None else 'не найден'}")
+        print(f"  Плейсхолдер текста: {'найден' if info.body_idx is not None else 'не найден'}")
+        print(f"  Плейсхолдер изображения: {'найден' if info.picture_idx is not None else 'не найден'}")
 
-        if len(prs.slides) > 2:
+        if info.has_final:
             print("Последний слайд: Найден")
         else:
             print("Предупреждение: Последний слайд отсутствует, он не будет добавлен")
@@ -43,4 +40,4 @@ def check_template(template_path="templates/template.pptx"):
         print(f"Ошибка при проверке шаблона: {e}")
 
 if __name__ == "__main__":
-    check_template()
\ No newline at end of file
+    check_template()
@@ -0,0 +1,331 @@
+import asyncio
+import heapq
+import hmac
+import ipaddress
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Tuple
+from dotenv import load_dotenv
+from loguru import logger
+from generate_presentation import metrics
+from generate_presentation.metrics import span
+
+load_dotenv()
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ADMISSION_CLIENT_HEADER = os.environ.get('ADMISSION_CLIENT_HEADER', 'X-Client-Id')
+ADMISSION_CLIENT_RATE = float(os.environ.get('ADMISSION_CLIENT_RATE', '2'))
+ADMISSION_CLIENT_BURST = float(os.environ.get('ADMISSION_CLIENT_BURST', '10'))
+ADMISSION_CLIENT_BUDGET = float(os.environ.get('ADMISSION_CLIENT_BUDGET', '1000'))
+ADMISSION_CLIENT_BUDGET_BURST = float(os.environ.get('ADMISSION_CLIENT_BUDGET_BURST', '400'))
+ADMISSION_IMAGE_COST = float(os.environ.get('ADMISSION_IMAGE_COST', '1'))
+ADMISSION_CAPACITY = float(os.environ.get('ADMISSION_CAPACITY', '200'))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '100'))
+ADMISSION_CLIENT_QUEUE = int(os.environ.get('ADMISSION_CLIENT_QUEUE', '20'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '60'))
+# Заголовку с идентификатором клиента доверяют только от перечисленных прокси (адреса или подсети)
+# или при явном ADMISSION_TRUST_CLIENT_HEADER=true; иначе клиент определяется по адресу подключения
+ADMISSION_TRUSTED_PROXIES = [item.strip() for item in os.environ.get('ADMISSION_TRUSTED_PROXIES', '').split(",") if item.strip()]
+ADMISSION_TRUST_CLIENT_HEADER = os.environ.get('ADMISSION_TRUST_CLIENT_HEADER', 'false').lower() in ('1', 'true', 'yes')
+ADMISSION_PRIORITY_HEADER = 'X-Priority'
+ADMISSION_PRIORITY_TOKEN_HEADER = 'X-Priority-Token'
+ADMISSION_PRIORITY_TOKENS = [token.strip() for token in os.environ.get('ADMISSION_PRIORITY_TOKENS', '').split(",") if token.strip()]
+ADMISSION_MAX_CLIENTS = 10000
+SERVICE_EWMA_ALPHA = 0.2
+
+HIGH, NORMAL, LOW = "high", "normal", "low"
+LANES = (HIGH, NORMAL, LOW)
+
+WAIT_SECONDS = metrics.registry.register(metrics.Histogram("presentation_admission_wait_seconds", "Время ожидания запроса в очереди планировщика", ("lane",)))
+SERVICE_SECONDS = metrics.registry.register(metrics.Histogram("presentation_admission_service_seconds", "Время выполнения запроса после допуска планировщиком", ("lane",)))
+REJECTED = metrics.registry.register(metrics.Counter("presentation_admission_rejected_total", "Число запросов, отклонённых планировщиком", ("reason",)))
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+def request_cost(slides: int, images: int, image_cost: float = ADMISSION_IMAGE_COST) -> float:
+    # Стоимость пропорциональна работе LLM (слайды) и API изображений
+    return slides + images * image_cost
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # Запрос дороже ёмкости корзины допускается при полной корзине и уводит её в минус
+        needed = min(amount, self.capacity) - self.tokens
+        if needed <= 0:
+            return 0.0
+        return needed / self.rate if self.rate > 0 else math.inf
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= amount
+
+    def refund(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class ClientState:
+    def __init__(self, rate: float, burst: float, budget: float, budget_burst: float, now: float):
+        self.requests = TokenBucket(rate, burst, now)
+        self.budget = TokenBucket(budget / 60, budget_burst, now)
+        self.finish: Dict[str, float] = {}
+        self.queued = 0
+
+class Ticket:
+    def __init__(self, client: str, cost: float, lane: str, start: float, future: asyncio.Future):
+        self.client = client
+        self.cost = cost
+        self.lane = lane
+        self.start = start
+        self.future = future
+        self.cancelled = False
+
+class AdmissionController:
+    def __init__(self,
+                 capacity: float = ADMISSION_CAPACITY,
+                 queue_size: int = ADMISSION_QUEUE_SIZE,
+                 client_queue: int = ADMISSION_CLIENT_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+                 rate: float = ADMISSION_CLIENT_RATE,
+                 burst: float = ADMISSION_CLIENT_BURST,
+                 budget: float = ADMISSION_CLIENT_BUDGET,
+                 budget_burst: float = ADMISSION_CLIENT_BUDGET_BURST,
+                 trusted_proxies: Iterable[str] = ADMISSION_TRUSTED_PROXIES,
+                 trust_client_header: bool = ADMISSION_TRUST_CLIENT_HEADER,
+                 priority_tokens: Iterable[str] = ADMISSION_PRIORITY_TOKENS,
+                 enabled: bool = ADMISSION_ENABLED):
+        self.capacity = capacity
+        self.queue_size = queue_size
+        self.client_queue = client_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+        self.budget = budget
+        self.budget_burst = budget_burst
+        self.trusted_proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in trusted_proxies]
+        self.trust_client_header = trust_client_header
+        self.priority_tokens = list(priority_tokens)
+        self.enabled = enabled
+        self.active = 0
+        self.active_cost = 0.0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self.__clients: Dict[str, ClientState] = {}
+        self.__queues: Dict[str, List[Tuple[float, int, Ticket]]] = {lane: [] for lane in LANES}
+        self.__virtual_time: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self.__sequence = itertools.count()
+        self.__service_ewma: Optional[float] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(self.queued_in(lane) for lane in LANES)
+
+    def queued_in(self, lane: str) -> int:
+        return sum(not ticket.cancelled for _, _, ticket in self.__queues[lane])
+
+    def from_trusted_proxy(self, peer: Optional[str]) -> bool:
+        try:
+            address = ipaddress.ip_address(peer or "")
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def client_for(self, headers: Mapping[str, str], peer: Optional[str]) -> str:
+        # Заголовок может выставить любой вызывающий: без доверия к нему новый идентификатор в каждом запросе
+        # обходил бы лимиты, а чужой — расходовал бы бюджет другого клиента
+        if self.trust_client_header or self.from_trusted_proxy(peer):
+            client = headers.get(ADMISSION_CLIENT_HEADER)
+            if client:
+                return client
+        return peer or "unknown"
+
+    def lane_for(self, headers: Mapping[str, str], peer: Optional[str]) -> str:
+        requested = (headers.get(ADMISSION_PRIORITY_HEADER) or NORMAL).lower()
+        if requested not in LANES:
+            return NORMAL
+        # Понизить приоритет может любой; высокий — только по токену или от доверенного прокси,
+        # который сам проверил клиента
+        if requested == HIGH and not (self.from_trusted_proxy(peer) or self._valid_token(headers.get(ADMISSION_PRIORITY_TOKEN_HEADER))):
+            return NORMAL
+        return requested
+
+    def _valid_token(self, token: Optional[str]) -> bool:
+        return bool(token) and any(hmac.compare_digest(token, expected) for expected in self.priority_tokens)
+
+    def _client(self, client: str, now: float) -> ClientState:
+        state = self.__clients.get(client)
+        if state is None:
+            if len(self.__clients) >= ADMISSION_MAX_CLIENTS:
+                self._forget_idle(now)
+            state = self.__clients[client] = ClientState(self.rate, self.burst, self.budget, self.budget_burst, now)
+        return state
+
+    def _forget_idle(self, now: float) -> None:
+        # Клиент с полными корзинами и без запросов в очереди неотличим от нового
+        for client, state in list(self.__clients.items()):
+            if not state.queued and state.requests.full(now) and state.budget.full(now):
+                del self.__clients[client]
+
+    def _reject(self, reason: str, retry_after: float, message: str) -> AdmissionRejected:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        REJECTED.inc(reason)
+        return AdmissionRejected(reason, retry_after, message)
+
+    def _estimated_wait(self) -> float:
+        service = self.__service_ewma if self.__service_ewma is not None else 1.0
+        return service * (1 + self.queued / max(1, self.active))
+
+    def charge(self, client: str, cost: float) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        state = self._client(client, now)
+        wait = state.requests.wait_time(1, now)
+        if wait > 0:
+            raise self._reject("rate", wait, "Слишком много запросов, повторите позже")
+        wait = state.budget.wait_time(cost, now)
+        if wait > 0:
+            raise self._reject("budget", wait, f"Исчерпан бюджет генерации (стоимость запроса {cost:g}), повторите позже")
+        state.requests.take(1, now)
+        state.budget.take(cost, now)
+
+    def _refund(self, state: ClientState, cost: float) -> None:
+        # Запрос, так и не допущенный к выполнению, не расходует лимиты клиента
+        now = time.monotonic()
+        state.requests.refund(1, now)
+        state.budget.refund(cost, now)
+
+    def _fits(self, cost: float) -> bool:
+        # Запрос дороже всей ёмкости выполняется, только когда других нет
+        return self.active == 0 or self.active_cost + cost <= self.capacity
+
+    def _start(self, cost: float) -> None:
+        self.active += 1
+        self.active_cost += cost
+        self.admitted += 1
+
+    def _head(self) -> Optional[Ticket]:
+        for lane in LANES:
+            queue = self.__queues[lane]
+            while queue and queue[0][2].cancelled:
+                heapq.heappop(queue)
+            if queue:
+                return queue[0][2]
+        return None
+
+    def _dispatch(self) -> None:
+        # Строгий приоритет между полосами, внутри полосы — справедливая очередь по виртуальному времени окончания.
+        # Голова очереди не обгоняется меньшими запросами, чтобы дорогие запросы не голодали
+        while True:
+            ticket = self._head()
+            if ticket is None or not self._fits(ticket.cost):
+                return
+            heapq.heappop(self.__queues[ticket.lane])
+            self.__virtual_time[ticket.lane] = ticket.start
+            self.__clients[ticket.client].queued -= 1
+            self._start(ticket.cost)
+            ticket.future.set_result(None)
+
+    def _release(self, cost: float, elapsed: float) -> None:
+        self.active -= 1
+        self.active_cost -= cost
+        self.__service_ewma = elapsed if self.__service_ewma is None else SERVICE_EWMA_ALPHA * elapsed + (1 - SERVICE_EWMA_ALPHA) * self.__service_ewma
+        self._dispatch()
+
+    async def _wait_turn(self, client: str, cost: float, lane: str, prepaid: bool) -> None:
+        state = self._client(client, time.monotonic())
+        immediate = self._head() is None and self._fits(cost)
+        if not immediate:
+            # Перегрузка проверяется до списания бюджета, а при отказе по таймауту бюджет возвращается:
+            # отклонённый запрос ничего не стоит клиенту
+            if self.queued >= self.queue_size:
+                raise self._reject("overload", self._estimated_wait(), "Сервер перегружен, повторите запрос позже")
+            if state.queued >= self.client_queue:
+                raise self._reject("client_queue", self._estimated_wait(), "Слишком много запросов клиента в очереди, повторите позже")
+        if not prepaid:
+            self.charge(client, cost)
+        if immediate:
+            self._start(cost)
+            return
+
+        # Виртуальное время окончания растёт со стоимостью запросов клиента: клиент с множеством
+        # дорогих запросов пропускает вперёд остальных
+        start = max(self.__virtual_time[lane], state.finish.get(lane, 0.0))
+        state.finish[lane] = start + cost
+        ticket = Ticket(client, cost, lane, start, asyncio.get_running_loop().create_future())
+        heapq.heappush(self.__queues[lane], (start + cost, next(self.__sequence), ticket))
+        state.queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.future.done():
+                # Очередь дошла одновременно с отменой: занятое место освобождается
+                self._release(cost, 0.0)
+            else:
+                ticket.cancelled = True
+                state.queued -= 1
+                if not prepaid:
+                    self._refund(state, cost)
+                # Снятый с головы запрос больше не задерживает стоящие за ним
+                self._dispatch()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("timeout", self._estimated_wait(), "Превышено время ожидания в очереди, повторите запрос позже")
+
+    @asynccontextmanager
+    async def admit(self, client: str, cost: float, lane: str = NORMAL, prepaid: bool = False) -> AsyncIterator[None]:
+        # prepaid — лимиты клиента уже списаны заранее (например, за весь пакет сразу)
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        with span("queue"):
+            await self._wait_turn(client, cost, lane, prepaid)
+        waited = time.perf_counter() - started
+        WAIT_SECONDS.observe(waited, lane)
+        if waited > 1:
+            logger.debug(f"Запрос клиента {client} (стоимость {cost:g}, полоса {lane}) ждал в очереди {waited:.2f} с")
+        started = time.perf_counter()
+        try:
+            with span("service"):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            SERVICE_SECONDS.observe(elapsed, lane)
+            self._release(cost, elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "capacity": self.capacity,
+            "active": self.active,
+            "active_cost": self.active_cost,
+            "queued": {lane: self.queued_in(lane) for lane in LANES},
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "clients": len(self.__clients),
+            "service_ewma": round(self.__service_ewma, 4) if self.__service_ewma is not None else None,
+        }
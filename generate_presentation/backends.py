@@ -0,0 +1,253 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+import aiohttp
+import httpx
+import openai
+from dotenv import load_dotenv
+from loguru import logger
+from generate_presentation import metrics
+
+load_dotenv()
+BACKEND_RETRIES = int(os.environ.get('BACKEND_RETRIES', '2'))
+BACKEND_RETRY_BASE_DELAY = float(os.environ.get('BACKEND_RETRY_BASE_DELAY', '0.5'))
+BACKEND_RETRY_MAX_DELAY = float(os.environ.get('BACKEND_RETRY_MAX_DELAY', '5'))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('BREAKER_RESET_TIMEOUT', '30'))
+BACKEND_CONNECT_TIMEOUT = float(os.environ.get('BACKEND_CONNECT_TIMEOUT', '5'))
+BACKEND_KEEPALIVE = float(os.environ.get('BACKEND_KEEPALIVE', '30'))
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+RETRIES = metrics.registry.register(metrics.Counter("presentation_backend_retries_total", "Число повторных запросов к внешним сервисам", ("backend",)))
+FAILURES = metrics.registry.register(metrics.Counter("presentation_backend_failures_total", "Число неудачных попыток запросов к внешним сервисам", ("backend",)))
+REJECTED = metrics.registry.register(metrics.Counter("presentation_backend_rejected_total", "Число запросов, отклонённых разомкнутым предохранителем", ("backend",)))
+BREAKER_STATE = metrics.registry.register(metrics.Gauge("presentation_backend_breaker_state", "Состояние предохранителя: 0 — замкнут, 1 — пробный запрос, 2 — разомкнут", ("backend",)))
+
+class CircuitOpenError(Exception):
+    def __init__(self, backend: str, retry_after: float):
+        super().__init__(f"Сервис {backend} временно недоступен, повторите через {retry_after:.0f} с")
+        self.backend = backend
+        self.retry_after = retry_after
+
+class BackendHTTPError(Exception):
+    def __init__(self, backend: str, status: int, message: str = ""):
+        super().__init__(f"Сервис {backend} вернул статус {status}: {message}")
+        self.status = status
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, BackendHTTPError):
+        return error.status == 429 or error.status >= 500
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (
+        asyncio.TimeoutError,
+        aiohttp.ClientConnectionError,
+        aiohttp.ClientPayloadError,
+        httpx.TransportError,
+        openai.APIConnectionError,
+    ))
+
+class CircuitBreaker:
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.__state = CLOSED
+        self.__failures = 0
+        self.__opened_at = 0.0
+        self.__probe = False
+        self.__lock = threading.Lock()
+        BREAKER_STATE.set(STATE_VALUES[CLOSED], name)
+
+    @property
+    def failures(self) -> int:
+        return self.__failures
+
+    @property
+    def state(self) -> str:
+        with self.__lock:
+            if self.__state == OPEN and time.monotonic() - self.__opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self.__state
+
+    def _set_state(self, state: str) -> None:
+        if self.__state != state:
+            logger.warning(f"Предохранитель {self.name}: {self.__state} -> {state}")
+        self.__state = state
+        BREAKER_STATE.set(STATE_VALUES[state], self.name)
+
+    def check(self) -> None:
+        # Быстрая проверка до постановки в очередь, не занимает пробный запрос
+        with self.__lock:
+            remaining = self.reset_timeout - (time.monotonic() - self.__opened_at)
+            if self.__state != OPEN or remaining <= 0:
+                return
+        REJECTED.inc(self.name)
+        raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def allow(self) -> None:
+        # После reset_timeout пропускается один пробный запрос; остальные отклоняются до его результата
+        with self.__lock:
+            if self.__state == CLOSED:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self.__opened_at)
+            if self.__state == OPEN and remaining <= 0:
+                self._set_state(HALF_OPEN)
+                self.__probe = False
+            if self.__state == HALF_OPEN and not self.__probe:
+                self.__probe = True
+                return
+        REJECTED.inc(self.name)
+        raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        with self.__lock:
+            self.__failures = 0
+            self.__probe = False
+            self._set_state(CLOSED)
+
+    def release_probe(self) -> None:
+        with self.__lock:
+            self.__probe = False
+
+    def record_failure(self) -> None:
+        with self.__lock:
+            self.__failures += 1
+            self.__probe = False
+            if self.__state == HALF_OPEN or self.__failures >= self.failure_threshold:
+                self.__opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self.__lock:
+            return {
+                "state": state,
+                "consecutive_failures": self.__failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+            }
+
+class BackendClient:
+    def __init__(self,
+                 name: str,
+                 deadline: float,
+                 retries: int = BACKEND_RETRIES,
+                 base_delay: float = BACKEND_RETRY_BASE_DELAY,
+                 max_delay: float = BACKEND_RETRY_MAX_DELAY,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.deadline = deadline
+        self.retries = max(0, retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker if breaker is not None else CircuitBreaker(name)
+        self.calls = 0
+        self.retried = 0
+        self.failed = 0
+
+    def retry_delay(self, attempt: int) -> float:
+        # Полный джиттер: повторы от разных запросов не приходят на сервис одновременно
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def record_failure(self, error: BaseException) -> None:
+        self.failed += 1
+        FAILURES.inc(self.name)
+        if is_transient(error):
+            self.breaker.record_failure()
+        else:
+            # Сервис ответил, пусть и ошибкой запроса: для предохранителя это признак работоспособности
+            self.breaker.record_success()
+
+    async def call(self, func: Callable[[], Awaitable[T]], deadline: Optional[float] = None) -> T:
+        self.breaker.allow()
+        self.calls += 1
+        deadline_at = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            try:
+                result = await asyncio.wait_for(func(), timeout=max(remaining, 0.001))
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except CircuitOpenError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                self.record_failure(e)
+                delay = self.retry_delay(attempt)
+                if not is_transient(e) or attempt >= self.retries or time.monotonic() + delay >= deadline_at:
+                    raise
+                attempt += 1
+                self.retried += 1
+                RETRIES.inc(self.name)
+                logger.warning(f"Сервис {self.name}: ошибка {type(e).__name__}, повтор {attempt}/{self.retries} через {delay:.2f} с")
+                await asyncio.sleep(delay)
+                # Пока шла пауза, предохранитель мог разомкнуться из-за других запросов
+                self.breaker.allow()
+                continue
+            self.breaker.record_success()
+            return result
+
+    def call_sync(self, func: Callable[[], T]) -> T:
+        self.breaker.allow()
+        self.calls += 1
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                result = func()
+            except CircuitOpenError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                self.record_failure(e)
+                delay = self.retry_delay(attempt)
+                if not is_transient(e) or attempt >= self.retries or time.monotonic() + delay >= deadline_at:
+                    raise
+                attempt += 1
+                self.retried += 1
+                RETRIES.inc(self.name)
+                logger.warning(f"Сервис {self.name}: ошибка {type(e).__name__}, повтор {attempt}/{self.retries} через {delay:.2f} с")
+                time.sleep(delay)
+                self.breaker.allow()
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "deadline": self.deadline,
+            "retries": self.retries,
+            "calls": self.calls,
+            "retried": self.retried,
+            "failed_attempts": self.failed,
+            "in_flight": metrics.IN_FLIGHT.value(self.name),
+            "waiting": metrics.WAITING.value(self.name),
+            "breaker": self.breaker.stats(),
+        }
+
+def httpx_limits(concurrency: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency, keepalive_expiry=BACKEND_KEEPALIVE)
+
+def httpx_timeout(read_timeout: float) -> httpx.Timeout:
+    return httpx.Timeout(read_timeout, connect=BACKEND_CONNECT_TIMEOUT)
+
+def aiohttp_connector(concurrency: int) -> aiohttp.TCPConnector:
+    return aiohttp.TCPConnector(limit=concurrency * 2, limit_per_host=concurrency * 2, keepalive_timeout=BACKEND_KEEPALIVE, ttl_dns_cache=300)
+
+def aiohttp_timeout(read_timeout: float) -> aiohttp.ClientTimeout:
+    return aiohttp.ClientTimeout(total=None, connect=BACKEND_CONNECT_TIMEOUT, sock_read=read_timeout)
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CACHE_DIR = Path(os.environ.get('CACHE_DIR', 'cache'))
+CACHE_MEMORY_MAX_BYTES = int(os.environ.get('CACHE_MEMORY_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_DISK_MAX_BYTES = int(os.environ.get('CACHE_DISK_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+def make_key(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class TieredCache:
+    def __init__(self,
+                 name: str,
+                 directory: Optional[Path] = None,
+                 memory_max_bytes: int = CACHE_MEMORY_MAX_BYTES,
+                 disk_max_bytes: int = CACHE_DISK_MAX_BYTES):
+        self.name = name
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.__memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self.__memory_bytes = 0
+        # Индекс диска в порядке LRU (ключ -> размер): вытеснение не пересканирует каталог
+        self.__disk: Optional["OrderedDict[str, int]"] = None
+        self.__disk_bytes = 0
+        self.__lock = threading.Lock()
+        self.__stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _remember(self, key: str, value: bytes) -> None:
+        if len(value) > self.memory_max_bytes:
+            return
+        previous = self.__memory.pop(key, None)
+        if previous is not None:
+            self.__memory_bytes -= len(previous)
+        self.__memory[key] = value
+        self.__memory_bytes += len(value)
+        while self.__memory_bytes > self.memory_max_bytes:
+            _, evicted = self.__memory.popitem(last=False)
+            self.__memory_bytes -= len(evicted)
+
+    def _scan_disk(self) -> "OrderedDict[str, int]":
+        # Один раз за время жизни процесса: порядок LRU восстанавливается по времени последнего доступа
+        entries = []
+        if self.directory.exists():
+            for path in self.directory.glob("*/*"):
+                if "." in path.name:
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, path.name, stat.st_size))
+        return OrderedDict((key, size) for _, key, size in sorted(entries))
+
+    def _disk_index(self) -> "OrderedDict[str, int]":
+        # Вызывается без блокировки: сканирование выполняется вне её, а гонка двух сканирований безвредна
+        if self.__disk is None:
+            index = self._scan_disk()
+            with self.__lock:
+                if self.__disk is None:
+                    self.__disk = index
+                    self.__disk_bytes = sum(index.values())
+        return self.__disk
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self.__lock:
+            value = self.__memory.get(key)
+            if value is not None:
+                self.__memory.move_to_end(key)
+                self.__stats["memory_hits"] += 1
+            return value
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        if self.directory is not None:
+            index = self._disk_index()
+            # Чтение с диска выполняется без блокировки, под ней только обновление индексов
+            path = self._path(key)
+            try:
+                value = path.read_bytes()
+                os.utime(path, (time.time(), time.time()))
+            except OSError:
+                value = None
+            if value is not None:
+                with self.__lock:
+                    if key in index:
+                        index.move_to_end(key)
+                    self._remember(key, value)
+                    self.__stats["disk_hits"] += 1
+                return value
+        with self.__lock:
+            self.__stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: bytes) -> None:
+        with self.__lock:
+            self._remember(key, value)
+            self.__stats["sets"] += 1
+        if self.directory is None:
+            return
+        index = self._disk_index()
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+            tmp_path.write_bytes(value)
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.error(f"Ошибка записи в кэш {self.name}: {e}")
+            return
+        victims: List[str] = []
+        with self.__lock:
+            self.__disk_bytes += len(value) - index.pop(key, 0)
+            index[key] = len(value)
+            while self.__disk_bytes > self.disk_max_bytes and len(index) > 1:
+                victim, size = index.popitem(last=False)
+                self.__disk_bytes -= size
+                victims.append(victim)
+            self.__stats["evictions"] += len(victims)
+        for victim in victims:
+            self._path(victim).unlink(missing_ok=True)
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value: Any) -> None:
+        self.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    # Асинхронные варианты: попадание в память обслуживается сразу, работа с диском — в потоке,
+    # чтобы не блокировать цикл событий
+    async def aget(self, key: str) -> Optional[bytes]:
+        if self.directory is None:
+            return self.get(key)
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: bytes) -> None:
+        if self.directory is None:
+            self.set(key, value)
+            return
+        await asyncio.to_thread(self.set, key, value)
+
+    async def aget_json(self, key: str) -> Any:
+        value = await self.aget(key)
+        return json.loads(value) if value is not None else None
+
+    async def aset_json(self, key: str, value: Any) -> None:
+        await self.aset(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            lookups = self.__stats["memory_hits"] + self.__stats["disk_hits"] + self.__stats["misses"]
+            hits = lookups - self.__stats["misses"]
+            return {
+                **self.__stats,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "memory_items": len(self.__memory),
+                "memory_bytes": self.__memory_bytes,
+                "disk_items": len(self.__disk) if self.__disk is not None else None,
+                "disk_bytes": self.__disk_bytes,
+            }
@@ -0,0 +1,194 @@
+import asyncio
+import fcntl
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+from loguru import logger
+from generate_presentation.models import GenerateRequest, SlideData, StoredDeck
+
+load_dotenv()
+DECK_STORE_ENABLED = os.environ.get('DECK_STORE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DECK_STORE_DIR = Path(os.environ.get('DECK_STORE_DIR', 'decks'))
+DECK_TTL = float(os.environ.get('DECK_TTL', str(24 * 3600)))
+DECK_SWEEP_INTERVAL = float(os.environ.get('DECK_SWEEP_INTERVAL', '600'))
+DECK_STORE_MAX_BYTES = int(os.environ.get('DECK_STORE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+DECK_FILE = "deck.json"
+LOCK_FILE = ".lock"
+
+class StaleDeckError(Exception):
+    pass
+
+class DeckStore:
+    # Данные слайдов и изображения сгенерированных презентаций, чтобы при правке пересобирать только изменённые слайды.
+    # Хранилище на диске, поэтому общее для всех обработчиков сервера
+    def __init__(self,
+                 root: Path = DECK_STORE_DIR,
+                 ttl: float = DECK_TTL,
+                 sweep_interval: float = DECK_SWEEP_INTERVAL,
+                 enabled: bool = DECK_STORE_ENABLED,
+                 max_bytes: int = DECK_STORE_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+
+    def deck_dir(self, deck_id: str) -> Path:
+        return self.root / deck_id
+
+    def photo_path(self, deck_id: str, photo: Optional[str]) -> Optional[str]:
+        if not photo:
+            return None
+        path = self.deck_dir(deck_id) / photo
+        return str(path) if path.exists() else None
+
+    def _store_photo(self, directory: Path, photo: Optional[str]) -> Optional[str]:
+        if not photo or not os.path.exists(photo):
+            return None
+        source = Path(photo)
+        existing = directory / source.name
+        # Изображение уже в хранилище (в том числе связанное с временным каталогом правки) сохраняет имя
+        if existing.exists() and os.path.samefile(source, existing):
+            return source.name
+        name = f"{uuid.uuid4().hex}{source.suffix}"
+        try:
+            # Жёсткая ссылка вместо копии: временный каталог запроса удаляется сразу после ответа
+            os.link(source, directory / name)
+        except OSError:
+            shutil.copyfile(source, directory / name)
+        return name
+
+    @contextmanager
+    def _locked(self, directory: Path) -> Iterator[None]:
+        # Блокировка файла, а не процесса: презентацию могут сохранять разные обработчики сервера
+        with open(directory / LOCK_FILE, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def save(self,
+             deck_id: str,
+             request: GenerateRequest,
+             slide_data: List[Dict],
+             created_at: Optional[float] = None,
+             base_version: Optional[int] = None) -> StoredDeck:
+        directory = self.deck_dir(deck_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._locked(directory):
+            version = 1
+            if base_version is not None:
+                # Правка, начатая с устаревшей версии, не должна затирать чужую и удалять её изображения
+                current = self.load(deck_id)
+                if current is None or current.version != base_version:
+                    raise StaleDeckError(f"Презентация {deck_id} изменена другим запросом")
+                version = current.version + 1
+            now = time.time()
+            slides = [
+                SlideData(zagolovok=slide["zagolovok"], opisanie=slide["opisanie"], photo=self._store_photo(directory, slide.get("photo")))
+                for slide in slide_data
+            ]
+            deck = StoredDeck(deck_id=deck_id, request=request, slides=slides, created_at=created_at or now, updated_at=now, version=version)
+            temp = directory / f".{DECK_FILE}.{uuid.uuid4().hex}.tmp"
+            temp.write_text(deck.model_dump_json(), encoding="utf-8")
+            os.replace(temp, directory / DECK_FILE)
+            self._remove_unused(directory, {slide.photo for slide in slides if slide.photo})
+        return deck
+
+    def snapshot_photos(self, slide_data: List[Dict], directory: Path) -> None:
+        # Изображения из хранилища связываются с временным каталогом запроса: параллельная правка
+        # может удалить их из хранилища, пока собирается презентация
+        for slide in slide_data:
+            photo = slide.get("photo")
+            if not photo:
+                continue
+            target = directory / Path(photo).name
+            try:
+                os.link(photo, target)
+            except FileNotFoundError:
+                raise StaleDeckError("Изображение презентации удалено другим запросом")
+            except OSError:
+                shutil.copyfile(photo, target)
+            slide["photo"] = str(target)
+
+    def _remove_unused(self, directory: Path, used: set) -> None:
+        for path in directory.iterdir():
+            if path.name != DECK_FILE and not path.name.startswith(".") and path.name not in used:
+                path.unlink(missing_ok=True)
+
+    def load(self, deck_id: str) -> Optional[StoredDeck]:
+        # Идентификатор приходит от клиента и не должен выводить за пределы хранилища
+        if not deck_id.isalnum():
+            return None
+        try:
+            return StoredDeck.model_validate_json((self.deck_dir(deck_id) / DECK_FILE).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Повреждённые данные презентации {deck_id}: {e}")
+            return None
+
+    async def asave(self,
+                    deck_id: str,
+                    request: GenerateRequest,
+                    slide_data: List[Dict],
+                    created_at: Optional[float] = None,
+                    base_version: Optional[int] = None) -> StoredDeck:
+        return await asyncio.to_thread(self.save, deck_id, request, slide_data, created_at, base_version)
+
+    async def aload(self, deck_id: str) -> Optional[StoredDeck]:
+        return await asyncio.to_thread(self.load, deck_id)
+
+    def _deck_size(self, path: Path) -> int:
+        return sum(file.stat().st_size for file in path.iterdir() if file.is_file())
+
+    def sweep(self) -> int:
+        if not self.root.exists():
+            return 0
+        deadline = time.time() - self.ttl
+        removed = 0
+        kept = []
+        for path in self.root.iterdir():
+            try:
+                marker = path / DECK_FILE
+                mtime = marker.stat().st_mtime if marker.exists() else path.stat().st_mtime
+                if mtime > deadline:
+                    kept.append((mtime, path, self._deck_size(path)))
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+            except OSError as e:
+                logger.error(f"Ошибка очистки {path}: {e}")
+        # Сверх лимита объёма удаляются презентации, которые дольше всего не менялись
+        total = sum(size for _, _, size in kept)
+        for _, path, size in sorted(kept, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            logger.debug(f"Удалено устаревших презентаций: {removed}")
+        return removed
+
+    async def run_sweeper(self) -> None:
+        if not self.enabled:
+            return
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Ошибка очистки хранилища презентаций: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        if not self.root.exists():
+            return {"decks": 0, "bytes_used": 0}
+        decks = [path for path in self.root.iterdir() if path.is_dir()]
+        return {"decks": len(decks), "bytes_used": sum(self._deck_size(deck) for deck in decks)}
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from loguru import logger
+from PIL import Image
+from pptx.util import Inches
+
+load_dotenv()
+IMAGE_PROCESSING = os.environ.get('IMAGE_PROCESSING', 'false').lower() in ('1', 'true', 'yes')
+IMAGE_DPI = int(os.environ.get('IMAGE_DPI', '150'))
+IMAGE_FORMAT = os.environ.get('IMAGE_FORMAT', 'jpeg').lower()
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '85'))
+IMAGE_PROCESS_WORKERS = int(os.environ.get('IMAGE_PROCESS_WORKERS', str(os.cpu_count() or 1)))
+
+# add_slide вставляет изображение шириной 3 дюйма, исходные изображения квадратные
+DEFAULT_PICTURE_SIZE = (Inches(3), Inches(3))
+EMU_PER_INCH = 914400
+FORMATS = {"jpeg": ("JPEG", ".jpg"), "png": ("PNG", ".png")}
+
+def target_pixels(size_emu: Tuple[int, int], dpi: int = IMAGE_DPI) -> Tuple[int, int]:
+    return (max(1, round(size_emu[0] / EMU_PER_INCH * dpi)), max(1, round(size_emu[1] / EMU_PER_INCH * dpi)))
+
+def process_image(path: str, target: Tuple[int, int], fmt: str = IMAGE_FORMAT, quality: int = IMAGE_QUALITY) -> Tuple[str, int, int]:
+    pil_format, suffix = FORMATS.get(fmt, FORMATS["jpeg"])
+    source = Path(path)
+    before = source.stat().st_size
+    with Image.open(source) as img:
+        # Изображение масштабируется так, чтобы покрыть область плейсхолдера: при вставке оно обрезается, а не растягивается
+        scale = max(target[0] / img.width, target[1] / img.height)
+        if scale < 1:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+        if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        destination = source.with_name(f"{source.stem}_{target[0]}x{target[1]}{suffix}")
+        if pil_format == "JPEG":
+            img.save(destination, pil_format, quality=quality, optimize=True)
+        else:
+            img.save(destination, pil_format, optimize=True)
+    after = destination.stat().st_size
+    if after >= before:
+        destination.unlink(missing_ok=True)
+        return path, before, before
+    return str(destination), before, after
+
+class ImageProcessor:
+    def __init__(self,
+                 workers: int = IMAGE_PROCESS_WORKERS,
+                 dpi: int = IMAGE_DPI,
+                 fmt: str = IMAGE_FORMAT,
+                 quality: int = IMAGE_QUALITY):
+        self.workers = max(1, workers)
+        self.dpi = dpi
+        self.fmt = fmt
+        self.quality = quality
+        self.__executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self.__executor
+
+    async def process_slides(self,
+                             slide_data: List[Dict],
+                             size_emu: Tuple[int, int] = DEFAULT_PICTURE_SIZE,
+                             shared: Optional[Dict[Tuple[str, Tuple[int, int]], asyncio.Future]] = None) -> Dict[str, Any]:
+        target = target_pixels(size_emu, self.dpi)
+        loop = asyncio.get_running_loop()
+        slides = [slide for slide in slide_data if slide.get("photo")]
+        # Одинаковые файлы (например, общие изображения в пакетной генерации) обрабатываются один раз;
+        # shared позволяет разделить результаты между несколькими презентациями
+        shared = shared if shared is not None else {}
+        photos = list(dict.fromkeys(slide["photo"] for slide in slides))
+        futures = []
+        owned = []
+        for photo in photos:
+            future = shared.get((photo, target))
+            if future is None:
+                future = loop.run_in_executor(self._get_executor(), process_image, photo, target, self.fmt, self.quality)
+                shared[(photo, target)] = future
+                owned.append(photo)
+            futures.append(future)
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        processed = {}
+        before_total = 0
+        after_total = 0
+        for photo, result in zip(photos, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Ошибка обработки изображения {photo}: {result}")
+                continue
+            processed[photo], before, after = result
+            if photo in owned:
+                before_total += before
+                after_total += after
+        for slide in slides:
+            slide["photo"] = processed.get(slide["photo"], slide["photo"])
+        stats = {"images": len(owned), "target": list(target), "bytes_before": before_total, "bytes_after": after_total}
+        logger.debug(f"Обработка изображений: {before_total} -> {after_total} байт ({len(owned)} шт., {target[0]}x{target[1]} px)")
+        return stats
+
+    def shutdown(self) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
@@ -0,0 +1,157 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import Callable, List, Optional
+import aiohttp
+from dotenv import load_dotenv
+from loguru import logger
+from generate_presentation.backends import BackendClient, BackendHTTPError, CircuitOpenError, aiohttp_connector, aiohttp_timeout
+from generate_presentation.cache import TieredCache, make_key
+from generate_presentation.metrics import in_flight, observe_payload, span, waiting
+from generate_presentation.scratch import ScratchDir
+
+load_dotenv()
+IMAGE_API_URL = f"{os.environ.get('IMAGE_API_HOST', 'http://192.168.0.59')}:{os.environ.get('IMAGE_API_PORT', '8087')}/llm_tools/image_generate"
+IMAGE_CONCURRENCY = int(os.environ.get('IMAGE_CONCURRENCY', '4'))
+IMAGE_TIMEOUT = float(os.environ.get('IMAGE_TIMEOUT', '120'))
+IMAGE_WIDTH = 768
+IMAGE_HEIGHT = 768
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+class ImageClient:
+    def __init__(self,
+                 api_url: str = IMAGE_API_URL,
+                 concurrency: int = IMAGE_CONCURRENCY,
+                 timeout: float = IMAGE_TIMEOUT,
+                 cache: Optional[TieredCache] = None):
+        self.cache = cache
+        self.api_url = api_url
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.backend = BackendClient("image", timeout)
+        self.__session: Optional[aiohttp.ClientSession] = None
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self) -> None:
+        # Сессия и семафор привязаны к циклу событий, в котором созданы
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop:
+            self.__loop = loop
+            self.__session = None
+            self.__semaphore = asyncio.Semaphore(self.concurrency)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        self._bind_loop()
+        if self.__session is None or self.__session.closed:
+            self.__session = aiohttp.ClientSession(connector=aiohttp_connector(self.concurrency), timeout=aiohttp_timeout(self.timeout))
+        return self.__session
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        self._bind_loop()
+        return self.__semaphore
+
+    async def _fetch_image(self, description: str, slide_index: int, scratch: ScratchDir) -> Optional[str]:
+        session = self._get_session()
+        params = {
+            "text": description,
+            "width": IMAGE_WIDTH,
+            "height": IMAGE_HEIGHT,
+            "return_format": "url"
+        }
+        with span("image_request"):
+            async with session.post(self.api_url, params=params) as response:
+                if response.status != 200:
+                    raise BackendHTTPError("image", response.status, await response.text())
+                image_url = await response.text()
+                image_url = image_url.strip('"')
+        with span("image_download"):
+            async with session.get(image_url) as img_response:
+                if img_response.status != 200:
+                    raise BackendHTTPError("image", img_response.status, "ошибка загрузки изображения")
+                file_path = scratch.path / f"slide_{slide_index}.png"
+                size = 0
+                try:
+                    with file_path.open("wb") as f:
+                        async for chunk in img_response.content.iter_chunked(IMAGE_CHUNK_SIZE):
+                            scratch.reserve(len(chunk))
+                            f.write(chunk)
+                            size += len(chunk)
+                except BaseException:
+                    # Недокачанный файл удаляется, чтобы повторная попытка не учитывала его объём дважды
+                    scratch.discard(file_path)
+                    raise
+        observe_payload("image", size)
+        return str(file_path)
+
+    async def _from_cache(self, key: str, slide_index: int, scratch: ScratchDir) -> Optional[str]:
+        data = await self.cache.aget(key)
+        if data is None:
+            return None
+        scratch.reserve(len(data))
+        file_path = scratch.path / f"slide_{slide_index}.png"
+        await asyncio.to_thread(file_path.write_bytes, data)
+        logger.debug(f"Изображение для слайда {slide_index + 1} взято из кэша")
+        return str(file_path)
+
+    async def generate_image(self, description: str, slide_index: int, scratch: ScratchDir, use_cache: bool = True) -> Optional[str]:
+        use_cache = use_cache and self.cache is not None
+        key = make_key("image", description, IMAGE_WIDTH, IMAGE_HEIGHT) if use_cache else None
+        if use_cache:
+            try:
+                cached_path = await self._from_cache(key, slide_index, scratch)
+            except Exception as e:
+                logger.error(f"Ошибка чтения изображения из кэша: {e}")
+                return None
+            if cached_path is not None:
+                return cached_path
+        try:
+            self.backend.breaker.check()
+        except CircuitOpenError as e:
+            # Сервис изображений недоступен: презентация собирается без изображения
+            logger.warning(f"Слайд {slide_index + 1} без изображения: {e}")
+            return None
+        semaphore = self._get_semaphore()
+        with waiting("image"):
+            await semaphore.acquire()
+        try:
+            with in_flight("image"):
+                path = await self.backend.call(lambda: self._fetch_image(description, slide_index, scratch))
+            if use_cache and path is not None:
+                await self.cache.aset(key, await asyncio.to_thread(Path(path).read_bytes))
+            return path
+        except CircuitOpenError as e:
+            logger.warning(f"Слайд {slide_index + 1} без изображения: {e}")
+            return None
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут генерации изображения для слайда {slide_index + 1} ({self.timeout} с)")
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка генерации изображения: {e}")
+            return None
+        finally:
+            semaphore.release()
+
+    async def generate_images(self,
+                              descriptions: List[str],
+                              scratch: ScratchDir,
+                              on_complete: Optional[Callable[[int, int], None]] = None,
+                              use_cache: bool = True) -> List[Optional[str]]:
+        done = 0
+
+        async def generate(description: str, slide_index: int) -> Optional[str]:
+            nonlocal done
+            path = await self.generate_image(description, slide_index, scratch, use_cache)
+            done += 1
+            if on_complete is not None:
+                on_complete(done, len(descriptions))
+            return path
+
+        return await asyncio.gather(*(
+            generate(description, i) for i, description in enumerate(descriptions)
+        ))
+
+    async def close(self) -> None:
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
+        self.__session = None
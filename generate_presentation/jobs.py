@@ -0,0 +1,254 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from dotenv import load_dotenv
+from loguru import logger
+from generate_presentation.models import GenerateRequest, JobInfo, JobStatus
+
+load_dotenv()
+JOB_MAX_CONCURRENT = int(os.environ.get('JOB_MAX_CONCURRENT', '2'))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '100'))
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', '3600'))
+JOB_RESULTS_DIR = Path(os.environ.get('JOB_RESULTS_DIR', 'results'))
+JOB_BACKEND = os.environ.get('JOB_BACKEND', 'memory')
+JOB_STATE_DIR = Path(os.environ.get('JOB_STATE_DIR', str(JOB_RESULTS_DIR / 'jobs')))
+
+ProgressReporter = Callable[..., None]
+JobRunner = Callable[[GenerateRequest, str, ProgressReporter], Awaitable[None]]
+
+class QueueFullError(Exception):
+    pass
+
+class JobBackend(ABC):
+    @abstractmethod
+    async def save(self, job: JobInfo) -> None: ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[JobInfo]: ...
+
+    @abstractmethod
+    async def delete(self, job_id: str) -> None: ...
+
+    @abstractmethod
+    async def expired(self, now: float) -> List[JobInfo]: ...
+
+class InMemoryJobBackend(JobBackend):
+    def __init__(self):
+        self.__jobs: Dict[str, JobInfo] = {}
+
+    async def save(self, job: JobInfo) -> None:
+        self.__jobs[job.job_id] = job
+
+    async def get(self, job_id: str) -> Optional[JobInfo]:
+        return self.__jobs.get(job_id)
+
+    async def delete(self, job_id: str) -> None:
+        self.__jobs.pop(job_id, None)
+
+    async def expired(self, now: float) -> List[JobInfo]:
+        return [job for job in self.__jobs.values() if job.expires_at is not None and job.expires_at <= now]
+
+class FileJobBackend(JobBackend):
+    # Состояние задач хранится в файлах, чтобы статус был виден из любого обработчика сервера
+    def __init__(self, directory: Path = JOB_STATE_DIR):
+        self.directory = directory
+        self.__written: Dict[str, float] = {}
+        self.__lock = threading.Lock()
+
+    def _path(self, job_id: str) -> Path:
+        return self.directory / f"{job_id}.json"
+
+    def _write(self, job_id: str, updated_at: float, data: str) -> None:
+        with self.__lock:
+            # Сохранения выполняются в потоках и могут завершиться не по порядку: устаревшее состояние не записывается
+            if updated_at < self.__written.get(job_id, 0.0):
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temp = self.directory / f".{job_id}.{uuid.uuid4().hex}.tmp"
+            temp.write_text(data, encoding="utf-8")
+            os.replace(temp, self._path(job_id))
+            self.__written[job_id] = updated_at
+
+    def _read(self, path: Path) -> Optional[JobInfo]:
+        try:
+            return JobInfo.model_validate_json(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Повреждённое состояние задачи {path}: {e}")
+            return None
+
+    def _delete(self, job_id: str) -> None:
+        with self.__lock:
+            self.__written.pop(job_id, None)
+            self._path(job_id).unlink(missing_ok=True)
+
+    def _expired(self, now: float) -> List[JobInfo]:
+        jobs = (self._read(path) for path in self.directory.glob("*.json"))
+        return [job for job in jobs if job is not None and job.expires_at is not None and job.expires_at <= now]
+
+    async def save(self, job: JobInfo) -> None:
+        await asyncio.to_thread(self._write, job.job_id, job.updated_at, job.model_dump_json())
+
+    async def get(self, job_id: str) -> Optional[JobInfo]:
+        return await asyncio.to_thread(self._read, self._path(job_id))
+
+    async def delete(self, job_id: str) -> None:
+        await asyncio.to_thread(self._delete, job_id)
+
+    async def expired(self, now: float) -> List[JobInfo]:
+        return await asyncio.to_thread(self._expired, now)
+
+def create_job_backend(kind: str = JOB_BACKEND) -> JobBackend:
+    if kind == "file":
+        return FileJobBackend()
+    return InMemoryJobBackend()
+
+class JobManager:
+    def __init__(self,
+                 runner: JobRunner,
+                 backend: Optional[JobBackend] = None,
+                 results_dir: Path = JOB_RESULTS_DIR,
+                 max_concurrent: int = JOB_MAX_CONCURRENT,
+                 queue_size: int = JOB_QUEUE_SIZE,
+                 result_ttl: float = JOB_RESULT_TTL):
+        self.runner = runner
+        self.backend = backend if backend is not None else create_job_backend()
+        self.results_dir = results_dir
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self.__requests: Dict[str, GenerateRequest] = {}
+        self.__queue: Optional[asyncio.Queue] = None
+        self.__tasks: List[asyncio.Task] = []
+        self.__saves: Dict[str, asyncio.Task] = {}
+        self.__unsaved: Set[str] = set()
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self.__queue.qsize() if self.__queue is not None else 0
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.__loop is loop:
+            return
+        self.__loop = loop
+        self.__queue = asyncio.Queue(maxsize=self.queue_size)
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        # Обработчики запускаются в пустом контексте, чтобы не унаследовать замеры запроса, который их создал
+        self.__tasks = [asyncio.create_task(self._worker(i), context=contextvars.Context()) for i in range(self.max_concurrent)]
+        self.__tasks.append(asyncio.create_task(self._evictor(), context=contextvars.Context()))
+        logger.debug(f"Планировщик задач запущен: {self.max_concurrent} обработчиков, очередь {self.queue_size}")
+
+    async def stop(self) -> None:
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__tasks = []
+        self.__loop = None
+
+    async def submit(self, gen_request: GenerateRequest) -> JobInfo:
+        self.start()
+        now = time.time()
+        job = JobInfo(job_id=uuid.uuid4().hex, status=JobStatus.queued, created_at=now, updated_at=now)
+        if self.__queue.full():
+            raise QueueFullError("Очередь задач переполнена, повторите запрос позже")
+        # Задача сохраняется до постановки в очередь: иначе обработчик может не найти её состояние
+        self.__requests[job.job_id] = gen_request
+        await self.backend.save(job)
+        try:
+            self.__queue.put_nowait(job.job_id)
+        except asyncio.QueueFull:
+            self.__requests.pop(job.job_id, None)
+            await self.backend.delete(job.job_id)
+            raise QueueFullError("Очередь задач переполнена, повторите запрос позже")
+        logger.debug(f"Задача {job.job_id} поставлена в очередь")
+        return job
+
+    async def get(self, job_id: str) -> Optional[JobInfo]:
+        return await self.backend.get(job_id)
+
+    def result_path(self, job_id: str) -> Path:
+        return self.results_dir / f"{job_id}.pptx"
+
+    async def _update(self, job: JobInfo, **fields: Any) -> None:
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.updated_at = time.time()
+        pending = self.__saves.get(job.job_id)
+        if pending is not None:
+            await pending
+        await self.backend.save(job)
+
+    def _reporter(self, job: JobInfo) -> ProgressReporter:
+        def report(stage: str, **details: Any) -> None:
+            job.stage = stage
+            job.progress[stage] = details
+            job.updated_at = time.time()
+            # Сохранения прогресса объединяются: пока идёт одно, новое не запускается,
+            # а следующее запишет последнее состояние задачи
+            self.__unsaved.add(job.job_id)
+            if job.job_id not in self.__saves:
+                self.__saves[job.job_id] = asyncio.get_running_loop().create_task(self._save_progress(job))
+        return report
+
+    async def _save_progress(self, job: JobInfo) -> None:
+        try:
+            while job.job_id in self.__unsaved:
+                self.__unsaved.discard(job.job_id)
+                await self.backend.save(job)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения прогресса задачи {job.job_id}: {e}")
+        finally:
+            self.__unsaved.discard(job.job_id)
+            self.__saves.pop(job.job_id, None)
+
+    async def _worker(self, worker_index: int) -> None:
+        while True:
+            job_id = await self.__queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self.__queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.backend.get(job_id)
+        gen_request = self.__requests.pop(job_id, None)
+        if job is None or gen_request is None:
+            return
+        await self._update(job, status=JobStatus.running)
+        output_path = self.result_path(job_id)
+        try:
+            await self.runner(gen_request, str(output_path), self._reporter(job))
+            if not output_path.exists():
+                raise RuntimeError("Не удалось сгенерировать презентацию")
+            await self._update(job, status=JobStatus.done, stage="done", expires_at=time.time() + self.result_ttl)
+            logger.debug(f"Задача {job_id} завершена")
+        except Exception as e:
+            logger.error(f"Ошибка выполнения задачи {job_id}: {e}")
+            await self._update(job, status=JobStatus.failed, error=str(e), expires_at=time.time() + self.result_ttl)
+
+    async def evict_expired(self) -> int:
+        expired = await self.backend.expired(time.time())
+        for job in expired:
+            self.result_path(job.job_id).unlink(missing_ok=True)
+            await self.backend.delete(job.job_id)
+        if expired:
+            logger.debug(f"Удалено просроченных задач: {len(expired)}")
+        return len(expired)
+
+    async def _evictor(self) -> None:
+        interval = max(1.0, min(self.result_ttl / 2, 60.0))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_expired()
+            except Exception as e:
+                logger.error(f"Ошибка очистки задач: {e}")
@@ -1,28 +1,38 @@
-from openai import AsyncOpenAI, OpenAI
+import asyncio
 import json
 from typing import Any, Dict, Optional, List
 from dotenv import load_dotenv
 import os
 from loguru import logger
+from generate_presentation.backends import BackendClient, CircuitOpenError
+from generate_presentation.llm_pool import EndpointPool, endpoints_from_env
+from generate_presentation.metrics import in_flight, span, waiting
 
 class LLM:
     __model: str = "Llama3"
-    __llama_url: str
-    __api_key: str
 
-    def __init__(self, base_url: Optional[str] = None):
+    def __init__(self, base_url: Optional[str] = None, concurrency: Optional[int] = None):
         load_dotenv()
         self.__model = os.environ.get('MODEL', 'Llama3')
-        self.__llama_url = base_url if base_url is not None else f"{os.environ['LLM_HOST']}:{os.environ['LLM_PORT']}/v1"
-        self.__api_key = "sk-no-key-required"
-        self.__aclient = AsyncOpenAI(
-            base_url=self.__llama_url,
-            api_key=self.__api_key
-        )
-        self.__client = OpenAI(
-            base_url=self.__llama_url,
-            api_key=self.__api_key
-        )
+        self.concurrency = max(1, concurrency if concurrency is not None else int(os.environ.get('LLM_CONCURRENCY', '4')))
+        self.timeout = float(os.environ.get('LLM_TIMEOUT', '120'))
+        self.backend = BackendClient("llm", self.timeout)
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        urls = [url.strip() for url in base_url.split(",")] if base_url is not None else endpoints_from_env()
+        self.pool = EndpointPool(urls, self.concurrency, self.timeout)
+
+    @property
+    def model(self) -> str:
+        return self.__model
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Ограничение одновременных запросов к LLM общее для всех запросов процесса
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop:
+            self.__loop = loop
+            self.__semaphore = asyncio.Semaphore(self.concurrency)
+        return self.__semaphore
 
     async def llama_generator(self,
                               text: str,
@@ -38,38 +48,102 @@ class LLM:
         messages.append({"role": "user", "content": text})
         if tool_call:
             messages.extend(tool_call)
-        logger.debug(f"Messages sent to LLM: {messages}")
+        # Полный текст сообщений не логируется: промпт может быть большим и содержать пользовательские данные
+        logger.debug(f"Запрос к LLM: {len(messages)} сообщений, {sum(len(m.get('content') or '') for m in messages)} символов")
         try:
-            stream = await self.__aclient.chat.completions.create(
-                model=self.__model,
-                stream=True,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p
-            )
-            async for chunk in stream:
-                yield chunk.choices[0].delta.content or ""
+            self.backend.breaker.check()
+            semaphore = self._get_semaphore()
+            with waiting("llm"):
+                await semaphore.acquire()
+            try:
+                with in_flight("llm"), span("llm_stream"):
+                    # Повторяется только открытие потока: начатый ответ повторить нельзя.
+                    # Потоковые запросы не дублируются, время открытия потока не учитывается в задержке сервера
+                    endpoint, stream = await self.backend.call(lambda: self.pool.call(
+                        lambda endpoint: endpoint.aclient().chat.completions.create(
+                            model=self.__model,
+                            stream=True,
+                            messages=messages,
+                            temperature=temperature,
+                            top_p=top_p
+                        ),
+                        hedge=False,
+                        record_latency=False
+                    ))
+                    with endpoint.track():
+                        try:
+                            async for chunk in stream:
+                                yield chunk.choices[0].delta.content or ""
+                        except Exception as e:
+                            self.backend.record_failure(e)
+                            endpoint.record_result(e)
+                            raise
+            finally:
+                semaphore.release()
+        except CircuitOpenError:
+            raise
         except Exception as e:
+            # Ошибка не передаётся текстом в поток: оборванный ответ не должен выглядеть завершённым
             logger.error(f"Ошибка в llama_generator: {e}")
-            yield f"Ошибка: {str(e)}"
+            raise
+
+    @staticmethod
+    def _json_request(text: str, system_prompt: str) -> Dict[str, Any]:
+        return {
+            "stream": False,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": text}
+            ],
+            "temperature": 0.1,
+            "response_format": {'type': 'json_object'},
+        }
 
     def llama_json(self,
                    text: str,
                    system_prompt: str = "The output is in JSON format",
                    ):
         try:
-            res = self.__client.chat.completions.create(
-                model=self.__model,
-                stream=False,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.1,
-                response_format={'type': 'json_object'},
-            )
+            with in_flight("llm"), span("llm"):
+                _, res = self.backend.call_sync(lambda: self.pool.call_sync(
+                    lambda endpoint: endpoint.client().chat.completions.create(
+                        model=self.__model,
+                        **self._json_request(text, system_prompt)
+                    )
+                ))
             tool = res.choices[0].message.content
-            return json.loads(tool)
+            with span("llm_parse"):
+                return json.loads(tool)
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка в llama_json: {e}")
+            return {'tool': 'unknown', 'args': {'text': text}}
+
+    async def llama_json_async(self,
+                               text: str,
+                               system_prompt: str = "The output is in JSON format",
+                               ):
+        try:
+            self.backend.breaker.check()
+            semaphore = self._get_semaphore()
+            with waiting("llm"):
+                await semaphore.acquire()
+            try:
+                with in_flight("llm"), span("llm"):
+                    _, res = await self.backend.call(lambda: self.pool.call(
+                        lambda endpoint: endpoint.aclient().chat.completions.create(
+                            model=self.__model,
+                            **self._json_request(text, system_prompt)
+                        )
+                    ))
+            finally:
+                semaphore.release()
+            tool = res.choices[0].message.content
+            with span("llm_parse"):
+                return json.loads(tool)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка в llama_json_async: {e}")
             return {'tool': 'unknown', 'args': {'text': text}}
\ No newline at end of file
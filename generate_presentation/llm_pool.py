@@ -0,0 +1,305 @@
+import asyncio
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+from urllib.parse import urlparse
+import httpx
+from dotenv import load_dotenv
+from loguru import logger
+from openai import AsyncOpenAI, OpenAI
+from generate_presentation import metrics
+from generate_presentation.backends import HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, httpx_limits, httpx_timeout, is_transient
+
+load_dotenv()
+LLM_BALANCING = os.environ.get('LLM_BALANCING', 'least_outstanding')
+LLM_HEDGING = os.environ.get('LLM_HEDGING', 'false').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', '20'))
+LLM_HEALTH_INTERVAL = float(os.environ.get('LLM_HEALTH_INTERVAL', '30'))
+LLM_HEALTH_TIMEOUT = float(os.environ.get('LLM_HEALTH_TIMEOUT', '2'))
+LLM_SLOW_FACTOR = float(os.environ.get('LLM_SLOW_FACTOR', '3'))
+LLM_FAILURE_COOLDOWN = float(os.environ.get('LLM_FAILURE_COOLDOWN', '5'))
+LATENCY_WINDOW = 200
+EWMA_ALPHA = 0.2
+
+T = TypeVar("T")
+
+HEDGED = metrics.registry.register(metrics.Counter("presentation_llm_hedged_total", "Число запросов к LLM, продублированных на второй сервер"))
+HEDGE_WINS = metrics.registry.register(metrics.Counter("presentation_llm_hedge_wins_total", "Число дублирующих запросов, ответивших раньше основного"))
+
+def endpoints_from_env() -> List[str]:
+    # LLM_ENDPOINTS — список базовых адресов через запятую; без него используется LLM_HOST:LLM_PORT
+    endpoints = [url.strip() for url in os.environ.get('LLM_ENDPOINTS', '').split(",") if url.strip()]
+    return endpoints or [f"{os.environ['LLM_HOST']}:{os.environ['LLM_PORT']}/v1"]
+
+class Endpoint:
+    def __init__(self, url: str, concurrency: int, timeout: float, api_key: str = "sk-no-key-required"):
+        self.url = url
+        self.name = urlparse(url).netloc or url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.api_key = api_key
+        self.breaker = CircuitBreaker(f"llm@{self.name}")
+        self.healthy = True
+        self.outstanding = 0
+        self.ewma: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.last_failure: Optional[float] = None
+        self.__client: Optional[OpenAI] = None
+        self.__aclient: Optional[AsyncOpenAI] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and self.breaker.state != OPEN
+
+    def client(self) -> OpenAI:
+        # Повторы выполняет BackendClient, встроенные повторы клиента OpenAI отключены
+        if self.__client is None:
+            self.__client = OpenAI(
+                base_url=self.url,
+                api_key=self.api_key,
+                max_retries=0,
+                http_client=httpx.Client(limits=httpx_limits(self.concurrency), timeout=httpx_timeout(self.timeout))
+            )
+        return self.__client
+
+    def aclient(self) -> AsyncOpenAI:
+        # Пул соединений асинхронного клиента привязан к циклу событий
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop:
+            self.__loop = loop
+            self.__aclient = AsyncOpenAI(
+                base_url=self.url,
+                api_key=self.api_key,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=httpx_limits(self.concurrency), timeout=httpx_timeout(self.timeout))
+            )
+        return self.__aclient
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        with self.__lock:
+            self.outstanding += 1
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.outstanding -= 1
+
+    def record_latency(self, seconds: float) -> None:
+        with self.__lock:
+            self.ewma = seconds if self.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma
+
+    def record_result(self, error: Optional[BaseException]) -> None:
+        if error is None:
+            self.breaker.record_success()
+        elif is_transient(error):
+            self.failures += 1
+            self.last_failure = time.monotonic()
+            self.breaker.record_failure()
+
+    def recently_failed(self, cooldown: float) -> bool:
+        return self.last_failure is not None and time.monotonic() - self.last_failure < cooldown
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "breaker": self.breaker.state,
+            "outstanding": self.outstanding,
+            "latency_ewma": round(self.ewma, 4) if self.ewma is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+class EndpointPool:
+    def __init__(self,
+                 urls: Sequence[str],
+                 concurrency: int,
+                 timeout: float,
+                 balancing: str = LLM_BALANCING,
+                 hedging: bool = LLM_HEDGING,
+                 hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+                 health_interval: float = LLM_HEALTH_INTERVAL,
+                 health_timeout: float = LLM_HEALTH_TIMEOUT,
+                 slow_factor: float = LLM_SLOW_FACTOR,
+                 failure_cooldown: float = LLM_FAILURE_COOLDOWN):
+        self.endpoints = [Endpoint(url, concurrency, timeout) for url in urls]
+        self.balancing = balancing
+        self.hedging = hedging
+        self.hedge_min_samples = hedge_min_samples
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.slow_factor = slow_factor
+        self.failure_cooldown = failure_cooldown
+        self.__latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _score(self, endpoint: Endpoint) -> Tuple[float, ...]:
+        # Сервер с ошибкой за последние failure_cooldown секунд идёт последним, чтобы повтор ушёл на другой сервер;
+        # после этого он снова участвует в выборе наравне с остальными, иначе ошибка никогда не сбросится.
+        # Сервер без замеров задержки получает приоритет, чтобы быстрее набрать статистику
+        recent = int(endpoint.recently_failed(self.failure_cooldown))
+        latency = endpoint.ewma if endpoint.ewma is not None else 0.0
+        if self.balancing == "latency":
+            return (recent, latency * (endpoint.outstanding + 1), endpoint.outstanding, endpoint.breaker.failures)
+        return (recent, endpoint.outstanding, latency, endpoint.breaker.failures)
+
+    def choose(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        available = [endpoint for endpoint in candidates if endpoint.available]
+        if not available:
+            # Все серверы выведены проверкой состояния: лучше попробовать медленный, чем отказать.
+            # Серверы с разомкнутым предохранителем не используются
+            available = [endpoint for endpoint in candidates if endpoint.breaker.state != OPEN]
+        for endpoint in sorted(available, key=self._score):
+            if endpoint.breaker.state == HALF_OPEN:
+                # Полуоткрытый предохранитель пропускает один пробный запрос, остальные уходят на другие серверы
+                try:
+                    endpoint.breaker.allow()
+                except CircuitOpenError:
+                    continue
+            return endpoint
+        raise CircuitOpenError("llm", min(endpoint.breaker.reset_timeout for endpoint in self.endpoints))
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedging or len(self.endpoints) < 2 or len(self.__latencies) < self.hedge_min_samples:
+            return None
+        return statistics.quantiles(self.__latencies, n=20)[-1]
+
+    async def _attempt(self, endpoint: Endpoint, func: Callable[[Endpoint], Awaitable[T]], record_latency: bool) -> T:
+        started = time.perf_counter()
+        endpoint.requests += 1
+        with endpoint.track():
+            try:
+                result = await func(endpoint)
+            except asyncio.CancelledError:
+                endpoint.breaker.release_probe()
+                # Проигравший дублирующий запрос: прошедшее время — нижняя оценка его задержки
+                if record_latency:
+                    endpoint.record_latency(time.perf_counter() - started)
+                raise
+            except Exception as e:
+                endpoint.record_result(e)
+                raise
+        endpoint.record_result(None)
+        if record_latency:
+            elapsed = time.perf_counter() - started
+            endpoint.record_latency(elapsed)
+            self.__latencies.append(elapsed)
+        return result
+
+    async def call(self, func: Callable[[Endpoint], Awaitable[T]], hedge: bool = True, record_latency: bool = True) -> Tuple[Endpoint, T]:
+        primary = self.choose()
+        delay = self.hedge_delay() if hedge else None
+        if delay is None:
+            return primary, await self._attempt(primary, func, record_latency)
+
+        tasks = {asyncio.ensure_future(self._attempt(primary, func, record_latency)): primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                # Основной сервер не ответил за p95: запрос дублируется на другой, используется первый ответ
+                secondary = next(iter(sorted((e for e in self.endpoints if e is not primary and e.available and e.breaker.state != HALF_OPEN), key=self._score)), None)
+                if secondary is not None:
+                    self.hedged += 1
+                    HEDGED.inc()
+                    tasks[asyncio.ensure_future(self._attempt(secondary, func, record_latency))] = secondary
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if tasks[task] is not primary:
+                        self.hedge_wins += 1
+                        HEDGE_WINS.inc()
+                    return tasks[task], task.result()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            # Отменённый запрос должен завершиться, чтобы счётчики незавершённых запросов были точными
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def call_sync(self, func: Callable[[Endpoint], T]) -> Tuple[Endpoint, T]:
+        endpoint = self.choose()
+        started = time.perf_counter()
+        endpoint.requests += 1
+        with endpoint.track():
+            try:
+                result = func(endpoint)
+            except Exception as e:
+                endpoint.record_result(e)
+                raise
+        endpoint.record_result(None)
+        elapsed = time.perf_counter() - started
+        endpoint.record_latency(elapsed)
+        self.__latencies.append(elapsed)
+        return endpoint, result
+
+    async def check_endpoint(self, endpoint: Endpoint) -> None:
+        started = time.perf_counter()
+        try:
+            await endpoint.aclient().with_options(timeout=self.health_timeout).models.list()
+            ok = True
+        except Exception as e:
+            logger.warning(f"Проверка LLM {endpoint.name} не пройдена: {e}")
+            ok = False
+        probe = time.perf_counter() - started
+        if ok:
+            # Сервер отвечает: прежние ошибки больше не должны отодвигать его в конец очереди выбора
+            endpoint.last_failure = None
+            if endpoint.breaker.failures:
+                endpoint.breaker.record_success()
+        if ok and not endpoint.healthy:
+            logger.info(f"LLM {endpoint.name} возвращён в ротацию ({probe:.2f} с)")
+            # Статистика задержки сбрасывается: сервер заново набирает её на живых запросах
+            endpoint.ewma = None
+        endpoint.healthy = ok
+
+    def mark_slow(self) -> None:
+        # Сервер, средняя задержка которого в slow_factor раз выше медианной по пулу, выводится из ротации
+        # до следующей успешной проверки
+        measured = [endpoint for endpoint in self.endpoints if endpoint.healthy and endpoint.ewma is not None]
+        if len(measured) < 2:
+            return
+        median = statistics.median(endpoint.ewma for endpoint in measured)
+        for endpoint in measured:
+            if endpoint.ewma > median * self.slow_factor:
+                logger.warning(f"LLM {endpoint.name} выведен из ротации: задержка {endpoint.ewma:.2f} с, медиана {median:.2f} с")
+                endpoint.healthy = False
+
+    async def check_health(self) -> None:
+        await asyncio.gather(*(self.check_endpoint(endpoint) for endpoint in self.endpoints))
+        self.mark_slow()
+
+    async def run_health_checks(self) -> None:
+        if len(self.endpoints) < 2:
+            return
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"Ошибка проверки серверов LLM: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "balancing": self.balancing,
+            "hedging": self.hedging,
+            "hedge_delay": self.hedge_delay(),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
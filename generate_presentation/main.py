@@ -1,124 +1,873 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from generate_presentation.models import PresentationRequest, GenerateRequest
-from generate_presentation.presentation_generator import generate_presentation
+from starlette.datastructures import MutableHeaders
+from generate_presentation.models import PresentationRequest, GenerateRequest, JobInfo, JobStatus, BatchItemResult, BatchStats, RegenerateRequest, StoredDeck
+from generate_presentation.presentation_generator import generate_presentation_bytes
 from generate_presentation.llm import LLM
 import os
 import shutil
 from pathlib import Path
-from typing import List
+from typing import Awaitable, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
 from loguru import logger
 import json
-import aiohttp
+import asyncio
+import contextvars
+import copy
+import uuid
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from tempfile import SpooledTemporaryFile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
+from generate_presentation.images import ImageClient
+from generate_presentation.scratch import ScratchDir, ScratchSpace
+from generate_presentation.decks import DeckStore, StaleDeckError
+from generate_presentation.streaming import SlideStreamParser
+from generate_presentation.outline import OUTLINE_MODE, build_outline_prompt, generate_outline_slides, write_slides
+from generate_presentation.cache import CACHE_DIR, CACHE_ENABLED, TieredCache, make_key, normalize_text
+from generate_presentation.template_registry import template_registry
+from generate_presentation.image_processing import DEFAULT_PICTURE_SIZE, IMAGE_PROCESSING, ImageProcessor
+from generate_presentation.backends import CircuitOpenError
+from generate_presentation.admission import AdmissionController, AdmissionRejected, LANES, LOW, request_cost, retry_after_header
+from generate_presentation.jobs import JobManager, ProgressReporter, QueueFullError
+from generate_presentation import metrics
+from generate_presentation.metrics import in_flight, observe_payload, span
 
 load_dotenv()
-IMAGE_API_URL = f"{os.environ.get('IMAGE_API_HOST', 'http://192.168.0.59')}:{os.environ.get('IMAGE_API_PORT', '8087')}/llm_tools/image_generate"
-
-app = FastAPI(title="Generate Presentation API")
+PPTX_WORKERS = int(os.environ.get('PPTX_WORKERS', '4'))
+PPTX_EXECUTOR = os.environ.get('PPTX_EXECUTOR', 'thread')
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+STREAM_CHUNK_SIZE = 64 * 1024
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '200'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+BATCH_SPOOL_MAX_SIZE = 32 * 1024 * 1024
 
+STATIC_DIR = Path(__file__).parent / "static"
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Сервер с несколькими обработчиками удаляет каталог сам, после остановки всех обработчиков
+REMOVE_UPLOADS_ON_SHUTDOWN = True
+
+# Момент запуска процесса; сервер с несколькими обработчиками переустанавливает его после fork
+process_started = time.perf_counter()
 
-app.mount("/static", StaticFiles(directory="generate_presentation/static"), name="static")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(preload)
+    background_tasks.append(asyncio.create_task(scratch_space.run_sweeper()))
+    background_tasks.append(asyncio.create_task(deck_store.run_sweeper()))
+    background_tasks.append(asyncio.create_task(llm.pool.run_health_checks()))
+    startup = time.perf_counter() - process_started
+    memory = metrics.process_memory()
+    metrics.STARTUP_SECONDS.set(startup)
+    logger.info(f"Процесс {os.getpid()} готов за {startup:.3f} с, память: {memory['rss'] / 2**20:.1f} МБ (собственная {memory['private'] / 2**20:.1f} МБ)")
+    try:
+        yield
+    finally:
+        await cleanup()
+
+app = FastAPI(title="Generate Presentation API", lifespan=lifespan)
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 llm = LLM()
+slide_cache = TieredCache("slides", CACHE_DIR / "slides")
+image_cache = TieredCache("images", CACHE_DIR / "images")
+image_client = ImageClient(cache=image_cache)
+scratch_space = ScratchSpace(UPLOAD_DIR)
+image_processor = ImageProcessor()
+admission = AdmissionController()
+deck_store = DeckStore()
+
+def create_executor(kind: str = PPTX_EXECUTOR, workers: int = PPTX_WORKERS) -> Executor:
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pptx")
+
+presentation_executor: Optional[Executor] = None
+
+def get_executor() -> Executor:
+    global presentation_executor
+    if presentation_executor is None:
+        presentation_executor = create_executor()
+    return presentation_executor
+
+async def run_in_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    call = partial(func, *args, **kwargs)
+    if isinstance(executor, ThreadPoolExecutor):
+        # Контекст передаётся в поток, чтобы замеры этапов сборки попали в Server-Timing запроса
+        call = partial(contextvars.copy_context().run, call)
+    with in_flight("pptx"):
+        return await loop.run_in_executor(executor, call)
+
+def noop_report(stage: str, **details) -> None:
+    pass
+
+def slide_count_for_llm(gen_request: GenerateRequest) -> int:
+    return gen_request.slide_count - 1 if not gen_request.template_mode else gen_request.slide_count - 2
+
+def generation_cost(gen_request: GenerateRequest) -> float:
+    # Изображения генерируются для слайдов, которые пишет LLM
+    return request_cost(gen_request.slide_count, slide_count_for_llm(gen_request))
+
+def peer_address(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+def client_id(request: Request) -> str:
+    return admission.client_for(request.headers, peer_address(request))
+
+def request_lane(request: Request) -> str:
+    return admission.lane_for(request.headers, peer_address(request))
+
+def rejected_response(e: AdmissionRejected) -> HTTPException:
+    logger.warning(f"Запрос отклонён планировщиком ({e.reason}): {e}")
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": retry_after_header(e.retry_after)})
+
+def normalized_topic(gen_request: GenerateRequest) -> str:
+    return " ".join(gen_request.topic.split())
+
+def build_prompt(gen_request: GenerateRequest) -> Tuple[str, str]:
+    topic = normalized_topic(gen_request)
+    prompt = f"Сгенерируй данные для презентации на тему '{topic}'. Верни результат в формате JSON, содержащем список слайдов, каждый из которых имеет поля 'zagolovok' (заголовок слайда) и 'opisanie' (описание слайда 200-230 слов). Количество слайдов: {slide_count_for_llm(gen_request)}. Пример: [{{\"zagolovok\": \"Слайд 1\", \"opisanie\": \"Описание слайда 1\"}}, {{\"zagolovok\": \"Слайд 2\", \"opisanie\": \"Описание слайда 2\"}}]"
+    system_prompt = "The output is in JSON format. Return a list of objects with 'zagolovok' and 'opisanie' fields."
+    return prompt, system_prompt
+
+def validate_slide(slide: Dict) -> None:
+    if not isinstance(slide, dict) or not all(key in slide for key in ["zagolovok", "opisanie"]):
+        logger.error(f"Некорректная структура слайда: {slide}")
+        raise ValueError(f"Слайд не содержит необходимые поля: {slide}")
+
+def validate_slide_data(slide_data) -> List[Dict]:
+    if isinstance(slide_data, dict) and 'slides' in slide_data:
+        slide_data = slide_data['slides']
+    if not isinstance(slide_data, list):
+        logger.error("LLM вернул некорректный формат данных, ожидался список")
+        raise ValueError(f"LLM вернул некорректный формат данных: {slide_data}")
+    for slide in slide_data:
+        validate_slide(slide)
+    return slide_data
+
+def attach_images(slide_data: List[Dict], image_paths: List[Optional[str]]) -> None:
+    for i, (slide, image_path) in enumerate(zip(slide_data, image_paths)):
+        if image_path:
+            slide["photo"] = image_path
+        else:
+            logger.warning(f"Не удалось сгенерировать изображение для слайда {i+1}")
+
+def slides_cache_key(prompt: str, system_prompt: str) -> str:
+    return make_key("slides", normalize_text(prompt), system_prompt, llm.model, 0.1)
+
+def outline_enabled(gen_request: GenerateRequest) -> bool:
+    return gen_request.outline_mode if gen_request.outline_mode is not None else OUTLINE_MODE
+
+def slide_texts_key(gen_request: GenerateRequest) -> str:
+    # В режиме плана слайды пишутся другими промптами, поэтому кэшируются отдельно
+    if outline_enabled(gen_request):
+        return slides_cache_key(*build_outline_prompt(normalized_topic(gen_request), slide_count_for_llm(gen_request)))
+    return slides_cache_key(*build_prompt(gen_request))
+
+async def generate_images_for(slide_data: List[Dict], scratch: ScratchDir, report: ProgressReporter = noop_report, use_cache: bool = True) -> None:
+    report("images", done=0, total=len(slide_data))
+    with span("images"):
+        image_paths = await image_client.generate_images(
+            [slide["opisanie"] for slide in slide_data],
+            scratch,
+            on_complete=lambda done, total: report("images", done=done, total=total),
+            use_cache=use_cache
+        )
+    attach_images(slide_data, image_paths)
+
+async def request_slide_texts(prompt: str, system_prompt: str, report: ProgressReporter = noop_report) -> List[Dict]:
+    report("llm")
+    slide_data = await llm.llama_json_async(prompt, system_prompt=system_prompt)
+    logger.debug(f"Данные от LLM: {slide_data}")
+    with span("validation"):
+        return validate_slide_data(slide_data)
+
+async def generate_slides(prompt: str, system_prompt: str, scratch: ScratchDir, report: ProgressReporter = noop_report, use_cache: bool = True) -> List[Dict]:
+    slide_data = await request_slide_texts(prompt, system_prompt, report)
+    await generate_images_for(slide_data, scratch, report, use_cache)
+    return slide_data
+
+async def generate_slides_streaming(prompt: str, system_prompt: str, max_slides: int, scratch: ScratchDir, report: ProgressReporter = noop_report, use_cache: bool = True) -> List[Dict]:
+    # Запрос изображения для слайда отправляется сразу, как только его JSON-объект завершён в потоке
+    parser = SlideStreamParser()
+    slide_data = []
+    image_tasks = []
+    report("llm", slides=0)
+    try:
+        async for token in llm.llama_generator(prompt, temperature=0.1, system_prompt=system_prompt):
+            for slide in parser.feed(token):
+                if len(slide_data) >= max_slides:
+                    continue
+                with span("validation"):
+                    validate_slide(slide)
+                logger.debug(f"Слайд {len(slide_data) + 1} получен из потока LLM")
+                image_tasks.append(asyncio.create_task(
+                    image_client.generate_image(slide["opisanie"], len(slide_data), scratch, use_cache)
+                ))
+                slide_data.append(slide)
+                report("llm", slides=len(slide_data))
+        if len(slide_data) < max_slides:
+            # Неполный ответ не возвращается и не попадает в кэш слайдов
+            raise ValueError(f"LLM вернул слайдов: {len(slide_data)} из {max_slides}")
+        report("images", total=len(image_tasks))
+        with span("images"):
+            image_paths = await asyncio.gather(*image_tasks)
+    except BaseException:
+        for task in image_tasks:
+            task.cancel()
+        raise
+    attach_images(slide_data, image_paths)
+    return slide_data
+
+async def request_outline_texts(gen_request: GenerateRequest, report: ProgressReporter = noop_report, on_slide=None) -> List[Dict]:
+    return await generate_outline_slides(llm, normalized_topic(gen_request), slide_count_for_llm(gen_request), on_slide, report)
+
+async def generate_slides_outline(gen_request: GenerateRequest, scratch: ScratchDir, report: ProgressReporter = noop_report, use_cache: bool = True) -> List[Dict]:
+    # Изображение для слайда запрашивается, как только готово его описание
+    image_tasks: Dict[int, asyncio.Task] = {}
+
+    def on_slide(index: int, slide: Dict) -> None:
+        image_tasks[index] = asyncio.create_task(image_client.generate_image(slide["opisanie"], index, scratch, use_cache))
+
+    try:
+        slide_data = await request_outline_texts(gen_request, report, on_slide)
+        report("images", total=len(image_tasks))
+        with span("images"):
+            image_paths = await asyncio.gather(*(image_tasks[i] for i in range(len(slide_data))))
+    except BaseException:
+        for task in image_tasks.values():
+            task.cancel()
+        raise
+    attach_images(slide_data, image_paths)
+    return slide_data
+
+async def cached_slide_texts(gen_request: GenerateRequest, cache_key: str, report: ProgressReporter = noop_report) -> Optional[List[Dict]]:
+    if not (CACHE_ENABLED and gen_request.use_cache):
+        return None
+    slide_data = await slide_cache.aget_json(cache_key)
+    if slide_data is not None:
+        logger.debug(f"Данные слайдов для темы '{gen_request.topic}' взяты из кэша")
+        report("llm", cached=True)
+    return slide_data
+
+async def store_slide_texts(gen_request: GenerateRequest, cache_key: str, slide_data: List[Dict]) -> None:
+    if CACHE_ENABLED and gen_request.use_cache:
+        await slide_cache.aset_json(cache_key, [{"zagolovok": slide["zagolovok"], "opisanie": slide["opisanie"]} for slide in slide_data])
+
+async def fetch_slide_texts(gen_request: GenerateRequest, report: ProgressReporter = noop_report) -> List[Dict]:
+    cache_key = slide_texts_key(gen_request)
+    slide_data = await cached_slide_texts(gen_request, cache_key, report)
+    if slide_data is None:
+        if outline_enabled(gen_request):
+            slide_data = await request_outline_texts(gen_request, report)
+        else:
+            slide_data = await request_slide_texts(*build_prompt(gen_request), report)
+        await store_slide_texts(gen_request, cache_key, slide_data)
+    return slide_data
+
+async def generate_slide_data(gen_request: GenerateRequest, scratch: ScratchDir, report: ProgressReporter = noop_report) -> List[Dict]:
+    use_cache = CACHE_ENABLED and gen_request.use_cache
+    prompt, system_prompt = build_prompt(gen_request)
+    cache_key = slide_texts_key(gen_request)
+    slide_data = await cached_slide_texts(gen_request, cache_key, report)
+    if slide_data is not None:
+        await generate_images_for(slide_data, scratch, report, use_cache)
+        return slide_data
+
+    if outline_enabled(gen_request):
+        slide_data = await generate_slides_outline(gen_request, scratch, report, use_cache)
+    elif gen_request.stream_mode:
+        slide_data = await generate_slides_streaming(prompt, system_prompt, slide_count_for_llm(gen_request), scratch, report, use_cache)
+    else:
+        slide_data = await generate_slides(prompt, system_prompt, scratch, report, use_cache)
+    await store_slide_texts(gen_request, cache_key, slide_data)
+    return slide_data
+
+def picture_size(gen_request: GenerateRequest) -> Tuple[int, int]:
+    if gen_request.template_mode:
+        size = template_registry.get(gen_request.template_name).picture_size
+        if size is not None:
+            return size
+    return DEFAULT_PICTURE_SIZE
+
+async def process_images(gen_request: GenerateRequest, slide_data: List[Dict], report: ProgressReporter = noop_report, shared: Optional[Dict] = None) -> None:
+    enabled = gen_request.optimize_images if gen_request.optimize_images is not None else IMAGE_PROCESSING
+    if not enabled or not any(slide.get("photo") for slide in slide_data):
+        return
+    report("processing")
+    with span("image_processing"):
+        stats = await image_processor.process_slides(slide_data, picture_size(gen_request), shared)
+    report("processing", **stats)
+
+async def render_deck(gen_request: GenerateRequest, slide_data: List[Dict], report: ProgressReporter = noop_report, shared_processing: Optional[Dict] = None) -> bytes:
+    await process_images(gen_request, slide_data, report, shared_processing)
+    return await assemble_deck(gen_request, slide_data, report)
+
+async def assemble_deck(gen_request: GenerateRequest, slide_data: List[Dict], report: ProgressReporter = noop_report) -> bytes:
+    report("assembly")
+    with span("assembly"):
+        deck = await run_in_executor(generate_presentation_bytes, slide_data, gen_request.slide_count, gen_request.topic, gen_request.template_mode, gen_request.template_name)
+    if deck is None:
+        raise RuntimeError("Не удалось сгенерировать презентацию")
+    observe_payload("deck", len(deck))
+    report("assembly", size=len(deck))
+    return deck
+
+def write_file(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+async def build_deck(gen_request: GenerateRequest, slide_data: List[Dict], output_path: str, report: ProgressReporter = noop_report) -> None:
+    deck = await render_deck(gen_request, slide_data, report)
+    await asyncio.to_thread(write_file, Path(output_path), deck)
+
+def output_filename(gen_request: GenerateRequest) -> str:
+    return os.path.basename(gen_request.output_path) if gen_request.output_path.endswith('.pptx') else "output.pptx"
+
+def iter_chunks(data: bytes, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[memoryview]:
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+def deck_response(deck: bytes, filename: str) -> StreamingResponse:
+    quoted = quote(filename)
+    if quoted != filename:
+        disposition = f"attachment; filename*=utf-8''{quoted}"
+    else:
+        disposition = f'attachment; filename="{filename}"'
+    headers = {
+        "Content-Disposition": disposition,
+        "Content-Length": str(len(deck)),
+        "X-Presentation-Size": str(len(deck)),
+    }
+    return StreamingResponse(iter_chunks(deck), media_type=PPTX_MEDIA_TYPE, headers=headers)
+
+async def run_generation(gen_request: GenerateRequest, output_path: str, report: ProgressReporter = noop_report) -> None:
+    async with scratch_space.request_dir() as scratch:
+        slide_data = await generate_slide_data(gen_request, scratch, report)
+        await build_deck(gen_request, slide_data, output_path, report)
+
+job_manager = JobManager(run_generation)
+
+def preload() -> None:
+    # Выполняется до запуска цикла событий: в сервере с несколькими обработчиками — один раз до fork,
+    # чтобы шаблоны разбирались один раз и память с ними была общей для обработчиков
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    if not template_registry.loaded:
+        template_registry.load()
+    if not template_registry.names():
+        logger.warning(f"Шаблоны не найдены в {template_registry.directory}: режим шаблона недоступен")
+
+metrics.registry.register(metrics.Gauge(
+    "presentation_job_queue_depth", "Число задач в очереди фоновой генерации",
+    callback=lambda: {(): job_manager.queue_depth}
+))
+metrics.registry.register(metrics.Gauge(
+    "presentation_llm_endpoint_outstanding", "Число незавершённых запросов к серверу LLM", ("endpoint",),
+    callback=lambda: {(endpoint.name,): endpoint.outstanding for endpoint in llm.pool.endpoints}
+))
+metrics.registry.register(metrics.Gauge(
+    "presentation_llm_endpoint_healthy", "Сервер LLM в ротации: 1 — да, 0 — нет", ("endpoint",),
+    callback=lambda: {(endpoint.name,): int(endpoint.available) for endpoint in llm.pool.endpoints}
+))
+metrics.registry.register(metrics.Gauge(
+    "presentation_admission_queued", "Число запросов в очереди планировщика", ("lane",),
+    callback=lambda: {(lane,): admission.queued_in(lane) for lane in LANES}
+))
+metrics.registry.register(metrics.Gauge(
+    "presentation_admission_active_cost", "Суммарная стоимость выполняющихся запросов",
+    callback=lambda: {(): admission.active_cost}
+))
+metrics.registry.register(metrics.Gauge(
+    "presentation_scratch_bytes", "Занятый объём временного хранилища",
+    callback=lambda: {(): scratch_space.bytes_used}
+))
+
+class BatchContext:
+    # Общие для всего пакета задачи: одинаковые темы и описания изображений запрашиваются один раз.
+    # Изображение удаляется из временного каталога, когда его больше не использует ни одна собираемая презентация
+    def __init__(self, scratch: ScratchDir):
+        self.scratch = scratch
+        self.text_tasks: Dict[str, asyncio.Task] = {}
+        self.image_tasks: Dict[Tuple[str, bool], asyncio.Task] = {}
+        self.image_refs: Dict[Tuple[str, bool], int] = {}
+        self.processing: Dict = {}
+        self.text_requests = 0
+        self.image_requests = 0
+        self.images_generated = 0
+
+    def slide_texts(self, gen_request: GenerateRequest) -> Awaitable[List[Dict]]:
+        self.text_requests += 1
+        key = slide_texts_key(gen_request)
+        if key not in self.text_tasks:
+            self.text_tasks[key] = asyncio.create_task(fetch_slide_texts(gen_request))
+        return self.text_tasks[key]
+
+    def image(self, description: str, use_cache: bool) -> Awaitable[Optional[str]]:
+        self.image_requests += 1
+        key = (description, use_cache)
+        if key not in self.image_tasks:
+            self.image_tasks[key] = asyncio.create_task(
+                image_client.generate_image(description, self.images_generated, self.scratch, use_cache)
+            )
+            self.images_generated += 1
+        self.image_refs[key] = self.image_refs.get(key, 0) + 1
+        return self.image_tasks[key]
+
+    def release_image(self, description: str, use_cache: bool) -> None:
+        key = (description, use_cache)
+        self.image_refs[key] -= 1
+        if self.image_refs[key] > 0:
+            return
+        del self.image_refs[key]
+        task = self.image_tasks.pop(key)
+        path = task.result() if task.done() and not task.cancelled() else None
+        if path:
+            # Словарь меняется на месте: презентации, уже собирающиеся с ним, должны видеть общие задачи обработки
+            for processed in [k for k in self.processing if k[0] == path]:
+                del self.processing[processed]
+            self.scratch.discard(Path(path))
+
+    def cancel(self) -> None:
+        for task in [*self.text_tasks.values(), *self.image_tasks.values()]:
+            task.cancel()
+
+async def generate_batch_item(context: BatchContext, gen_request: GenerateRequest) -> bytes:
+    slide_data = copy.deepcopy(await context.slide_texts(gen_request))
+    use_cache = CACHE_ENABLED and gen_request.use_cache
+    descriptions = [slide["opisanie"] for slide in slide_data]
+    try:
+        image_paths = await asyncio.gather(*(context.image(description, use_cache) for description in descriptions))
+        attach_images(slide_data, image_paths)
+        return await render_deck(gen_request, slide_data, shared_processing=context.processing)
+    finally:
+        for description in descriptions:
+            context.release_image(description, use_cache)
+
+def batch_entry_name(index: int, gen_request: GenerateRequest) -> str:
+    return f"{index + 1:03d}_{output_filename(gen_request)}"
+
+def iter_file(file: BinaryIO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    try:
+        file.seek(0)
+        while chunk := file.read(chunk_size):
+            yield chunk
+    finally:
+        file.close()
+
+async def run_batch(gen_requests: List[GenerateRequest], archive: zipfile.ZipFile, client: str) -> Tuple[List[BatchItemResult], BatchStats]:
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+    archive_lock = asyncio.Lock()
+    results: List[BatchItemResult] = []
+
+    async with scratch_space.request_dir() as scratch:
+        context = BatchContext(scratch)
+
+        async def run_item(index: int, gen_request: GenerateRequest) -> BatchItemResult:
+            async with slots:
+                item_started = time.perf_counter()
+                result = BatchItemResult(index=index, topic=gen_request.topic, status="done")
+                try:
+                    # Каждая презентация пакета проходит общий планировщик в низкой полосе и занимает его ёмкость
+                    async with admission.admit(client, generation_cost(gen_request), LOW, prepaid=True):
+                        deck = await generate_batch_item(context, gen_request)
+                    result.filename = batch_entry_name(index, gen_request)
+                    result.size = len(deck)
+                    # ZIP_STORED: .pptx уже сжат, повторное сжатие только тратит процессор
+                    async with archive_lock:
+                        await asyncio.to_thread(archive.writestr, result.filename, deck)
+                except Exception as e:
+                    logger.error(f"Пакетная генерация: ошибка для темы '{gen_request.topic}': {e}")
+                    result.status = "failed"
+                    result.error = str(e)
+                result.seconds = round(time.perf_counter() - item_started, 3)
+                return result
 
-async def generate_image(description: str, slide_index: int) -> str:
-    async with aiohttp.ClientSession() as session:
-        params = {
-            "text": description,
-            "width": 768,
-            "height": 768,
-            "return_format": "url"
-        }
         try:
-            async with session.post(IMAGE_API_URL, params=params) as response:
-                if response.status != 200:
-                    logger.error(f"Ошибка API изображений: {await response.text()}")
-                    return None
-                image_url = await response.text()
-                image_url = image_url.strip('"')
-                async with session.get(image_url) as img_response:
-                    if img_response.status != 200:
-                        logger.error(f"Ошибка загрузки изображения: {img_response.status}")
-                        return None
-                    file_path = UPLOAD_DIR / f"slide_{slide_index}.png"
-                    with file_path.open("wb") as f:
-                        f.write(await img_response.read())
-                    return str(file_path)
-        except Exception as e:
-            logger.error(f"Ошибка генерации изображения: {e}")
-            return None
+            results = await asyncio.gather(*(run_item(i, r) for i, r in enumerate(gen_requests)))
+        finally:
+            context.cancel()
 
-@app.get("/")
-async def root():
-    return {"message": "Добро пожаловать в API генерации презентаций!"}
+    elapsed = time.perf_counter() - started
+    succeeded = sum(1 for result in results if result.status == "done")
+    stats = BatchStats(
+        decks=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        unique_topics=len(context.text_tasks),
+        llm_requests_saved=context.text_requests - len(context.text_tasks),
+        unique_images=context.images_generated,
+        image_requests_saved=context.image_requests - context.images_generated,
+        seconds=round(elapsed, 3),
+        decks_per_minute=round(succeeded / elapsed * 60, 2) if elapsed > 0 else 0.0,
+    )
+    logger.debug(f"Пакетная генерация завершена: {stats}")
+    return results, stats
 
-@app.post("/generate-from-topic/")
-async def generate_from_topic(
-    request: str = Form(...)
-):
+def parse_generate_request(request: str) -> GenerateRequest:
     try:
         request_data = json.loads(request)
-        gen_request = GenerateRequest(**request_data)
     except json.JSONDecodeError:
         logger.error("Неверный формат JSON в поле 'request'")
         raise HTTPException(status_code=422, detail="Неверный формат JSON в поле 'request'")
+    return build_generate_request(request_data)
+
+def build_generate_request(request_data) -> GenerateRequest:
+    try:
+        gen_request = GenerateRequest(**request_data)
     except Exception as e:
         logger.error(f"Ошибка валидации данных: {e}")
         raise HTTPException(status_code=422, detail=f"Ошибка валидации данных: {str(e)}")
 
     if gen_request.template_mode and (gen_request.slide_count < 3 or gen_request.slide_count > 20):
         raise HTTPException(status_code=422, detail="Количество слайдов для шаблонного режима должно быть от 3 до 20")
+    if gen_request.template_mode and gen_request.template_name not in template_registry.names():
+        raise HTTPException(status_code=422, detail=f"Шаблон '{gen_request.template_name}' не найден")
+    return gen_request
 
-    slide_count_for_llm = gen_request.slide_count - 1 if not gen_request.template_mode else gen_request.slide_count - 2
-    prompt = f"Сгенерируй данные для презентации на тему '{gen_request.topic}'. Верни результат в формате JSON, содержащем список слайдов, каждый из которых имеет поля 'zagolovok' (заголовок слайда) и 'opisanie' (описание слайда 200-230 слов). Количество слайдов: {slide_count_for_llm}. Пример: [{{\"zagolovok\": \"Слайд 1\", \"opisanie\": \"Описание слайда 1\"}}, {{\"zagolovok\": \"Слайд 2\", \"opisanie\": \"Описание слайда 2\"}}]"
-    system_prompt = "The output is in JSON format. Return a list of objects with 'zagolovok' and 'opisanie' fields."
+background_tasks: List[asyncio.Task] = []
+
+class TimingMiddleware:
+    # Обычное ASGI-промежуточное ПО, а не @app.middleware: ответ, в том числе потоковый,
+    # не проходит через дополнительную задачу и поток в памяти. Подключается только при включённых метриках
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        timings = metrics.start_request_timings()
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                # Шаблон маршрута вместо пути, чтобы идентификаторы задач не размножали метки
+                route = scope.get("route")
+                path = getattr(route, "path", "unmatched")
+                metrics.REQUESTS.inc(path, str(message["status"]))
+                metrics.REQUEST_SECONDS.observe(elapsed, path)
+                timings.append(("total", elapsed))
+                MutableHeaders(scope=message)["Server-Timing"] = metrics.server_timing_header(timings)
+            await send(message)
+
+        await self.app(scope, receive, send_with_timings)
+
+if metrics.METRICS_ENABLED:
+    app.add_middleware(TimingMiddleware)
+
+@app.get("/")
+async def root():
+    return {"message": "Добро пожаловать в API генерации презентаций!"}
 
+@app.get("/templates")
+async def list_templates():
+    return {"templates": template_registry.names()}
+
+@app.post("/generate-from-topic/")
+async def generate_from_topic(
+    http_request: Request,
+    request: str = Form(...)
+):
+    gen_request = parse_generate_request(request)
+    client = client_id(http_request)
+    lane = request_lane(http_request)
+    try:
+        async with admission.admit(client, generation_cost(gen_request), lane):
+            return await generate_deck_response(gen_request)
+    except AdmissionRejected as e:
+        raise rejected_response(e)
+
+async def generate_deck_response(gen_request: GenerateRequest) -> StreamingResponse:
+    async with scratch_space.request_dir() as scratch:
+        try:
+            slide_data = await generate_slide_data(gen_request, scratch)
+        except CircuitOpenError as e:
+            logger.error(f"LLM недоступен: {e}")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+        except Exception as e:
+            logger.error(f"Ошибка при запросе к LLM: {e}")
+            raise HTTPException(status_code=500, detail=f"Ошибка генерации данных слайдов: {str(e)}")
+
+        try:
+            deck = await render_deck(gen_request, slide_data)
+        except Exception as e:
+            logger.error(f"Ошибка сборки презентации: {e}")
+            raise HTTPException(status_code=500, detail="Не удалось сгенерировать презентацию")
+        deck_id = await store_deck(gen_request, slide_data)
+    logger.debug(f"Презентация '{gen_request.topic}' собрана в памяти: {len(deck)} байт")
+    response = deck_response(deck, output_filename(gen_request))
+    if deck_id is not None:
+        response.headers["X-Deck-Id"] = deck_id
+    return response
+
+async def store_deck(gen_request: GenerateRequest, slide_data: List[Dict]) -> Optional[str]:
+    # Сохраняется до удаления временного каталога, чтобы изображения можно было переиспользовать при правке.
+    # Хранение только по запросу клиента; объём хранилища (DECK_STORE_MAX_BYTES) поддерживает периодическая очистка
+    if not (deck_store.enabled and gen_request.keep_deck):
+        return None
+    deck_id = uuid.uuid4().hex
     try:
-        slide_data = llm.llama_json(prompt, system_prompt=system_prompt)
-        logger.debug(f"Данные от LLM: {slide_data}")
-        if isinstance(slide_data, dict) and 'slides' in slide_data:
-            slide_data = slide_data['slides']
-        if not isinstance(slide_data, list):
-            logger.error("LLM вернул некорректный формат данных, ожидался список")
-            raise ValueError(f"LLM вернул некорректный формат данных: {slide_data}")
-        for slide in slide_data:
-            if not all(key in slide for key in ["zagolovok", "opisanie"]):
-                logger.error(f"Некорректная структура слайда: {slide}")
-                raise ValueError(f"Слайд не содержит необходимые поля: {slide}")
+        await deck_store.asave(deck_id, gen_request, slide_data)
     except Exception as e:
-        logger.error(f"Ошибка при запросе к LLM: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка генерации данных слайдов: {str(e)}")
-    for i, slide in enumerate(slide_data):
-        image_path = await generate_image(slide["opisanie"], i)
-        if image_path:
-            slide["photo"] = image_path
+        logger.error(f"Не удалось сохранить презентацию {deck_id}: {e}")
+        return None
+    return deck_id
+
+def parse_regenerate_request(request: str) -> RegenerateRequest:
+    try:
+        return RegenerateRequest.model_validate_json(request)
+    except ValueError as e:
+        logger.error(f"Ошибка валидации данных: {e}")
+        raise HTTPException(status_code=422, detail=f"Ошибка валидации данных: {str(e)}")
+
+def plan_regeneration(stored: StoredDeck, regen_request: RegenerateRequest) -> Tuple[GenerateRequest, List[Dict], List[int], Dict[int, bool]]:
+    gen_request = stored.request
+    if regen_request.presentation is not None:
+        presentation = regen_request.presentation
+        gen_request = build_generate_request({**stored.request.model_dump(), "slide_count": presentation.slide_count, "output_path": presentation.output_path})
+        if len(presentation.slides) != slide_count_for_llm(gen_request):
+            raise ValueError(f"Ожидалось слайдов с содержимым: {slide_count_for_llm(gen_request)}, получено: {len(presentation.slides)}")
+        source = presentation.slides
+    else:
+        source = stored.slides
+    # Пути изображений от клиента не принимаются: изображения берутся только из хранилища
+    slide_data = [{"zagolovok": slide.zagolovok, "opisanie": slide.opisanie} for slide in source]
+
+    rewrite: List[int] = []
+    fresh = set()
+    for edit in regen_request.edits:
+        if not 0 <= edit.index < len(slide_data):
+            raise ValueError(f"Слайд {edit.index} отсутствует в презентации")
+        if edit.zagolovok is not None:
+            slide_data[edit.index]["zagolovok"] = edit.zagolovok
+        if edit.opisanie is not None:
+            slide_data[edit.index]["opisanie"] = edit.opisanie
+        if edit.regenerate_text and edit.index not in rewrite:
+            rewrite.append(edit.index)
+        if edit.regenerate_image:
+            fresh.add(edit.index)
+
+    # Изображение зависит только от описания, поэтому сопоставляется по нему, а не по номеру слайда:
+    # переставленные слайды и слайды с изменённым заголовком сохраняют изображения
+    photos = {normalize_text(slide.opisanie): deck_store.photo_path(stored.deck_id, slide.photo) for slide in stored.slides}
+    redraw: Dict[int, bool] = {}
+    for index, slide in enumerate(slide_data):
+        photo = photos.get(normalize_text(slide["opisanie"]))
+        if index in rewrite or index in fresh or photo is None:
+            # Новое изображение по запросу пользователя не берётся из кэша, иначе вернётся прежнее
+            redraw[index] = index not in fresh
         else:
-            logger.warning(f"Не удалось сгенерировать изображение для слайда {i+1}")
+            slide["photo"] = photo
+    return gen_request, slide_data, rewrite, redraw
+
+async def regenerate_slides(gen_request: GenerateRequest, slide_data: List[Dict], rewrite: List[int], redraw: Dict[int, bool], scratch: ScratchDir, use_cache: bool = True) -> None:
+    if rewrite:
+        titles = [slide["zagolovok"] for slide in slide_data]
+        rewritten = await write_slides(llm, normalized_topic(gen_request), titles, rewrite)
+        for index, slide in rewritten.items():
+            slide_data[index]["opisanie"] = slide["opisanie"]
+    if not redraw:
+        return
+    with span("images"):
+        image_paths = await asyncio.gather(*(
+            image_client.generate_image(slide_data[index]["opisanie"], index, scratch, use_cache and cached)
+            for index, cached in redraw.items()
+        ))
+    changed = [slide_data[index] for index in redraw]
+    attach_images(changed, image_paths)
+    # Обрабатываются только новые изображения: сохранённые уже подготовлены под размер слайда
+    await process_images(gen_request, changed)
+
+@app.get("/decks/stats")
+async def decks_stats():
+    return await asyncio.to_thread(deck_store.stats)
+
+@app.get("/decks/{deck_id}", response_model=StoredDeck)
+async def get_deck(deck_id: str):
+    stored = await deck_store.aload(deck_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Презентация не найдена")
+    return stored
+
+@app.post("/decks/{deck_id}/regenerate/")
+async def regenerate_deck(
+    deck_id: str,
+    http_request: Request,
+    request: str = Form(...)
+):
+    regen_request = parse_regenerate_request(request)
+    stored = await deck_store.aload(deck_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Презентация не найдена")
+    try:
+        gen_request, slide_data, rewrite, redraw = plan_regeneration(stored, regen_request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    client = client_id(http_request)
+    lane = request_lane(http_request)
+    # Стоимость правки — только работа по изменённым слайдам
+    cost = max(1.0, request_cost(len(rewrite), len(redraw)))
+    use_cache = regen_request.use_cache if regen_request.use_cache is not None else gen_request.use_cache
+    try:
+        async with admission.admit(client, cost, lane):
+            async with scratch_space.request_dir() as scratch:
+                try:
+                    await asyncio.to_thread(deck_store.snapshot_photos, slide_data, scratch.path)
+                except StaleDeckError as e:
+                    raise HTTPException(status_code=409, detail=str(e))
+                try:
+                    await regenerate_slides(gen_request, slide_data, rewrite, redraw, scratch, CACHE_ENABLED and use_cache)
+                except CircuitOpenError as e:
+                    logger.error(f"LLM недоступен: {e}")
+                    raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+                except Exception as e:
+                    logger.error(f"Ошибка перегенерации слайдов: {e}")
+                    raise HTTPException(status_code=500, detail=f"Ошибка перегенерации слайдов: {str(e)}")
+                try:
+                    deck = await assemble_deck(gen_request, slide_data)
+                except Exception as e:
+                    logger.error(f"Ошибка сборки презентации: {e}")
+                    raise HTTPException(status_code=500, detail="Не удалось сгенерировать презентацию")
+                try:
+                    await deck_store.asave(deck_id, gen_request, slide_data, stored.created_at, stored.version)
+                except StaleDeckError as e:
+                    raise HTTPException(status_code=409, detail=str(e))
+    except AdmissionRejected as e:
+        raise rejected_response(e)
+
+    logger.debug(f"Презентация {deck_id} пересобрана: изменено слайдов {len(redraw)} из {len(slide_data)}")
+    response = deck_response(deck, output_filename(gen_request))
+    response.headers["X-Deck-Id"] = deck_id
+    response.headers["X-Regenerated-Slides"] = ",".join(str(index) for index in sorted(redraw))
+    return response
+
+@app.post("/generate-batch/")
+async def generate_batch(
+    http_request: Request,
+    requests: str = Form(...)
+):
+    try:
+        items = json.loads(requests)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=422, detail="Неверный формат JSON в поле 'requests'")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=422, detail="Поле 'requests' должно содержать непустой список запросов")
+    if len(items) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=422, detail=f"Максимальный размер пакета: {BATCH_MAX_SIZE}")
+    gen_requests = [build_generate_request(item) for item in items]
+    # Лимиты клиента списываются за весь пакет сразу, а его презентации выполняются через общую очередь
+    # в низкой полосе, не больше BATCH_CONCURRENCY одновременно
+    client = client_id(http_request)
+    try:
+        admission.charge(client, sum(generation_cost(gen_request) for gen_request in gen_requests))
+    except AdmissionRejected as e:
+        raise rejected_response(e)
+
+    spool = SpooledTemporaryFile(max_size=BATCH_SPOOL_MAX_SIZE)
+    try:
+        with zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_STORED) as archive:
+            results, stats = await run_batch(gen_requests, archive, client)
+            manifest = {"results": [result.model_dump() for result in results], "stats": stats.model_dump()}
+            archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+        size = spool.tell()
+    except BaseException:
+        spool.close()
+        raise
+
+    headers = {
+        "Content-Disposition": 'attachment; filename="presentations.zip"',
+        "Content-Length": str(size),
+        "X-Batch-Succeeded": str(stats.succeeded),
+        "X-Batch-Failed": str(stats.failed),
+    }
+    return StreamingResponse(iter_file(spool), media_type="application/zip", headers=headers)
+
+@app.post("/jobs/", status_code=202, response_model=JobInfo)
+async def submit_job(
+    http_request: Request,
+    request: str = Form(...)
+):
+    gen_request = parse_generate_request(request)
+    try:
+        admission.charge(client_id(http_request), generation_cost(gen_request))
+    except AdmissionRejected as e:
+        raise rejected_response(e)
+    try:
+        return await job_manager.submit(gen_request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str):
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
 
-    output_path = gen_request.output_path if gen_request.output_path.endswith('.pptx') else "output.pptx"
-    generate_presentation(slide_data, gen_request.slide_count, output_path, gen_request.topic, gen_request.template_mode)
-    
-    if not os.path.exists(output_path):
-        raise HTTPException(status_code=500, detail="Не удалось сгенерировать презентацию")
-    
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    if job.status == JobStatus.failed:
+        raise HTTPException(status_code=500, detail=f"Задача завершилась с ошибкой: {job.error}")
+    if job.status != JobStatus.done:
+        return JSONResponse(status_code=409, content={"detail": "Задача ещё выполняется", "status": job.status.value})
+    result_path = job_manager.result_path(job_id)
+    if not result_path.exists():
+        raise HTTPException(status_code=410, detail="Результат задачи удалён")
     return FileResponse(
-        path=output_path,
-        filename=output_path,
-        media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+        path=result_path,
+        filename=f"{job_id}.pptx",
+        media_type=PPTX_MEDIA_TYPE
     )
 
-@app.on_event("shutdown")
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"slides": slide_cache.stats(), "images": image_cache.stats()}
+
+@app.get("/backends/stats")
+async def backends_stats():
+    return {"llm": {**llm.backend.stats(), "pool": llm.pool.stats()}, "image": image_client.backend.stats()}
+
+@app.get("/admission/stats")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/scratch/stats")
+async def scratch_stats():
+    return scratch_space.stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/server/stats")
+async def server_stats():
+    return {"pid": os.getpid(), "startup_seconds": metrics.STARTUP_SECONDS.value(), "memory": metrics.process_memory()}
+
 async def cleanup():
-    if UPLOAD_DIR.exists():
-        for file in UPLOAD_DIR.glob("*"):
-            file.unlink()
-        try:
-            UPLOAD_DIR.rmdir()
-        except:
-            pass
-    if os.path.exists("output.pptx"):
-        os.remove("output.pptx")
\ No newline at end of file
+    global presentation_executor
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await job_manager.stop()
+    await image_client.close()
+    if presentation_executor is not None:
+        presentation_executor.shutdown(wait=False)
+        presentation_executor = None
+    image_processor.shutdown()
+    if REMOVE_UPLOADS_ON_SHUTDOWN and UPLOAD_DIR.exists():
+        shutil.rmtree(UPLOAD_DIR, ignore_errors=True)
@@ -0,0 +1,208 @@
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.__values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self.__values[labels] = self.__values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return super().render() + [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in self.__values.items()]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labels)
+        self.__values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self.__values[labels] = self.__values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self.__values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self.__values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            for labels, value in self.callback().items():
+                self.set(value, *labels)
+        with self._lock:
+            return super().render() + [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in self.__values.items()]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.__counts: Dict[LabelValues, List[int]] = {}
+        self.__sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            counts = self.__counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self.__sums[labels] = self.__sums.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for labels, counts in self.__counts.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, ('le', str(bound)))} {cumulative}")
+                cumulative += counts[-1]
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, ('le', '+Inf'))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {self.__sums[labels]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.__metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.__metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.register(Histogram("presentation_stage_seconds", "Длительность этапов генерации презентации", ("stage",)))
+PAYLOAD_BYTES = registry.register(Histogram("presentation_payload_bytes", "Размер передаваемых данных", ("kind",), SIZE_BUCKETS))
+IN_FLIGHT = registry.register(Gauge("presentation_backend_in_flight", "Число выполняющихся запросов к внешним сервисам", ("backend",)))
+WAITING = registry.register(Gauge("presentation_backend_waiting", "Число запросов, ожидающих свободного слота внешнего сервиса", ("backend",)))
+REQUESTS = registry.register(Counter("presentation_http_requests_total", "Число HTTP-запросов", ("path", "status")))
+REQUEST_SECONDS = registry.register(Histogram("presentation_http_request_seconds", "Длительность HTTP-запросов", ("path",)))
+STARTUP_SECONDS = registry.register(Gauge("presentation_process_startup_seconds", "Время от запуска процесса (или ответвления обработчика) до готовности приложения"))
+
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+@contextmanager
+def _tracked(gauge: Gauge, backend: str) -> Iterator[None]:
+    if not METRICS_ENABLED:
+        yield
+        return
+    gauge.inc(backend)
+    try:
+        yield
+    finally:
+        gauge.dec(backend)
+
+def in_flight(backend: str):
+    return _tracked(IN_FLIGHT, backend)
+
+def waiting(backend: str):
+    return _tracked(WAITING, backend)
+
+def observe_payload(kind: str, size: int) -> None:
+    if METRICS_ENABLED:
+        PAYLOAD_BYTES.observe(size, kind)
+
+def start_request_timings() -> List[Tuple[str, float]]:
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    # Этапы, выполнявшиеся несколько раз (изображения, слайды), суммируются
+    totals: Dict[str, List[float]] = {}
+    for stage, elapsed in timings:
+        total = totals.setdefault(stage, [0.0, 0])
+        total[0] += elapsed
+        total[1] += 1
+    return ", ".join(f'{stage};dur={total * 1000:.1f};desc="x{count}"' for stage, (total, count) in totals.items())
+
+def process_memory() -> Dict[str, int]:
+    # rss включает страницы, общие с главным процессом после fork; private — собственная память обработчика
+    memory = {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, "private": 0}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name == "Rss":
+                    memory["rss"] = int(value.split()[0]) * 1024
+                elif name in ("Private_Clean", "Private_Dirty"):
+                    memory["private"] += int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return memory
+
+PROCESS_MEMORY = registry.register(Gauge(
+    "presentation_process_memory_bytes", "Память процесса", ("kind",),
+    callback=lambda: {(kind,): value for kind, value in process_memory().items()}
+))
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from enum import Enum
+from typing import Any, Dict, List, Optional
 
 class SlideData(BaseModel):
     zagolovok: str
@@ -15,4 +16,67 @@ class GenerateRequest(BaseModel):
     topic: str
     slide_count: int
     output_path: str = "output.pptx"
-    template_mode: bool = False
\ No newline at end of file
+    template_mode: bool = False
+    template_name: str = "template"
+    stream_mode: bool = False
+    use_cache: bool = True
+    optimize_images: Optional[bool] = None
+    outline_mode: Optional[bool] = None
+    keep_deck: bool = False
+
+class SlideEdit(BaseModel):
+    # index — номер слайда с содержимым, начиная с 0 (без титульного и завершающего)
+    index: int
+    zagolovok: Optional[str] = None
+    opisanie: Optional[str] = None
+    regenerate_text: bool = False
+    regenerate_image: bool = False
+
+class RegenerateRequest(BaseModel):
+    presentation: Optional[PresentationRequest] = None
+    edits: List[SlideEdit] = []
+    use_cache: Optional[bool] = None
+
+class StoredDeck(BaseModel):
+    deck_id: str
+    request: GenerateRequest
+    slides: List[SlideData]
+    created_at: float
+    updated_at: float
+    version: int = 1
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+class JobInfo(BaseModel):
+    job_id: str
+    status: JobStatus
+    stage: Optional[str] = None
+    progress: Dict[str, Dict[str, Any]] = {}
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+    expires_at: Optional[float] = None
+
+class BatchItemResult(BaseModel):
+    index: int
+    topic: str
+    filename: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+    size: int = 0
+    seconds: float = 0.0
+
+class BatchStats(BaseModel):
+    decks: int
+    succeeded: int
+    failed: int
+    unique_topics: int
+    llm_requests_saved: int
+    unique_images: int
+    image_requests_saved: int
+    seconds: float
+    decks_per_minute: float
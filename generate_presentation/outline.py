@@ -0,0 +1,113 @@
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from loguru import logger
+from pydantic import ValidationError
+from generate_presentation.jobs import ProgressReporter
+from generate_presentation.llm import LLM
+from generate_presentation.metrics import span
+from generate_presentation.models import SlideData
+
+load_dotenv()
+OUTLINE_MODE = os.environ.get('OUTLINE_MODE', 'false').lower() in ('1', 'true', 'yes')
+OUTLINE_SLIDE_RETRIES = int(os.environ.get('OUTLINE_SLIDE_RETRIES', '2'))
+
+OUTLINE_SYSTEM_PROMPT = "The output is in JSON format. Return an object with a 'titles' field containing a list of strings."
+SLIDE_SYSTEM_PROMPT = "The output is in JSON format. Return an object with an 'opisanie' field."
+
+def build_outline_prompt(topic: str, count: int) -> Tuple[str, str]:
+    prompt = f"Составь план презентации на тему '{topic}'. Верни результат в формате JSON с полем 'titles' — списком заголовков слайдов. Количество слайдов: {count}. Пример: {{\"titles\": [\"Слайд 1\", \"Слайд 2\"]}}"
+    return prompt, OUTLINE_SYSTEM_PROMPT
+
+def build_slide_prompt(topic: str, titles: List[str], index: int) -> Tuple[str, str]:
+    outline = "; ".join(f"{i + 1}. {title}" for i, title in enumerate(titles))
+    prompt = f"Презентация на тему '{topic}', план: {outline}. Напиши описание слайда {index + 1} '{titles[index]}' (200-230 слов), не повторяя содержание остальных слайдов. Верни результат в формате JSON с полем 'opisanie'. Пример: {{\"opisanie\": \"Описание слайда\"}}"
+    return prompt, SLIDE_SYSTEM_PROMPT
+
+def parse_titles(data: Any, count: int) -> List[str]:
+    if isinstance(data, dict):
+        data = data.get("titles", data.get("slides"))
+    if not isinstance(data, list):
+        raise ValueError(f"LLM вернул некорректный план презентации: {data}")
+    titles = []
+    for item in data:
+        title = item.get("zagolovok") if isinstance(item, dict) else item
+        if isinstance(title, str) and title.strip():
+            titles.append(title.strip())
+    if len(titles) < count:
+        raise ValueError(f"План содержит {len(titles)} слайдов вместо {count}")
+    return titles[:count]
+
+def parse_slide(data: Any, title: str) -> Dict:
+    opisanie = data.get("opisanie") if isinstance(data, dict) else None
+    # Каждый слайд проверяется отдельно: ошибка в одном не отбрасывает остальные
+    slide = SlideData(zagolovok=title, opisanie=opisanie)
+    if not slide.opisanie.strip():
+        raise ValueError(f"Пустое описание слайда '{title}'")
+    return {"zagolovok": slide.zagolovok, "opisanie": slide.opisanie}
+
+async def request_outline(llm: LLM, topic: str, count: int, retries: int = OUTLINE_SLIDE_RETRIES) -> List[str]:
+    prompt, system_prompt = build_outline_prompt(topic, count)
+    for attempt in range(retries + 1):
+        data = await llm.llama_json_async(prompt, system_prompt=system_prompt)
+        try:
+            with span("validation"):
+                return parse_titles(data, count)
+        except ValueError as e:
+            if attempt >= retries:
+                raise
+            logger.warning(f"Повтор запроса плана презентации ({attempt + 1}/{retries}): {e}")
+
+async def request_slide(llm: LLM, topic: str, titles: List[str], index: int) -> Dict:
+    prompt, system_prompt = build_slide_prompt(topic, titles, index)
+    data = await llm.llama_json_async(prompt, system_prompt=system_prompt)
+    with span("validation"):
+        return parse_slide(data, titles[index])
+
+async def write_slides(llm: LLM,
+                      topic: str,
+                      titles: List[str],
+                      indices: List[int],
+                      on_slide: Optional[Callable[[int, Dict], None]] = None,
+                      report: Optional[ProgressReporter] = None,
+                      retries: int = OUTLINE_SLIDE_RETRIES) -> Dict[int, Dict]:
+    report = report or (lambda stage, **details: None)
+    slides: Dict[int, Dict] = {}
+
+    async def write_slide(index: int) -> None:
+        slide = await request_slide(llm, topic, titles, index)
+        slides[index] = slide
+        # Слайд передаётся дальше (например, на генерацию изображения), не дожидаясь остальных
+        if on_slide is not None:
+            on_slide(index, slide)
+
+    pending = list(indices)
+    for attempt in range(retries + 1):
+        results = await asyncio.gather(*(write_slide(i) for i in pending), return_exceptions=True)
+        failed = []
+        for index, result in zip(pending, results):
+            if isinstance(result, (ValidationError, ValueError)):
+                logger.warning(f"Слайд {index + 1} '{titles[index]}' не прошёл проверку: {result}")
+                failed.append(index)
+            elif isinstance(result, BaseException):
+                raise result
+        report("llm", slides=len(slides), total=len(indices))
+        if not failed:
+            return slides
+        # Повторно запрашиваются только слайды, не прошедшие проверку
+        pending = failed
+    raise ValueError(f"Не удалось получить описания слайдов: {[i + 1 for i in pending]}")
+
+async def generate_outline_slides(llm: LLM,
+                                  topic: str,
+                                  count: int,
+                                  on_slide: Optional[Callable[[int, Dict], None]] = None,
+                                  report: Optional[ProgressReporter] = None,
+                                  retries: int = OUTLINE_SLIDE_RETRIES) -> List[Dict]:
+    report = report or (lambda stage, **details: None)
+    report("llm", phase="outline")
+    titles = await request_outline(llm, topic, count, retries)
+    logger.debug(f"План презентации '{topic}': {titles}")
+    slides = await write_slides(llm, topic, titles, list(range(len(titles))), on_slide, report, retries)
+    return [slides[i] for i in range(len(titles))]
@@ -3,8 +3,13 @@ from pptx.util import Pt, Inches
 from pptx.enum.text import PP_ALIGN
 from pptx.enum.shapes import MSO_SHAPE_TYPE
 import os
-from typing import List, Dict
+from io import BytesIO
+from typing import List, Dict, Optional
 from loguru import logger
+from generate_presentation.metrics import span
+from generate_presentation.template_registry import (
+    CONTENT_LAYOUT_INDEX, DEFAULT_TEMPLATE, FINAL_LAYOUT_INDEX, TemplateInfo, template_registry
+)
 
 def create_presentation(slide_count: int) -> Presentation:
     prs = Presentation()
@@ -28,10 +33,21 @@ def add_template_title_slide(prs: Presentation, topic: str) -> None:
     else:
         logger.warning("На титульном слайде отсутствует плейсхолдер заголовка")
 
-def add_template_content_slide(prs: Presentation, data: Dict, slide_index: int) -> None:
+def find_placeholder(slide, placeholder_type: int, idx: Optional[int] = None):
+    if idx is not None:
+        try:
+            return slide.placeholders[idx]
+        except KeyError:
+            pass
+    for shape in slide.placeholders:
+        if shape.placeholder_format.type == placeholder_type:
+            return shape
+    return None
+
+def add_template_content_slide(prs: Presentation, data: Dict, slide_index: int, info: Optional[TemplateInfo] = None) -> None:
     if len(prs.slide_layouts) < 2:
         raise ValueError("Шаблон не содержит макет для основного слайда")
-    slide_layout = prs.slide_layouts[1]
+    slide_layout = prs.slide_layouts[CONTENT_LAYOUT_INDEX]
     slide = prs.slides.add_slide(slide_layout)
     logger.debug(f"Добавлен основной слайд {slide_index} с макетом {slide_layout.name}")
     title = slide.shapes.title
@@ -41,11 +57,7 @@ def add_template_content_slide(prs: Presentation, data: Dict, slide_index: int)
     else:
         logger.warning(f"Слайд {slide_index}: Плейсхолдер заголовка не найден или заголовок отсутствует")
 
-    content_placeholder = None
-    for shape in slide.placeholders:
-        if shape.placeholder_format.type == 7:
-            content_placeholder = shape
-            break
+    content_placeholder = find_placeholder(slide, 7, info.body_idx if info else None)
     if content_placeholder and 'opisanie' in data and data['opisanie']:
         content_placeholder.text_frame.clear()
         p = content_placeholder.text_frame.add_paragraph()
@@ -54,11 +66,7 @@ def add_template_content_slide(prs: Presentation, data: Dict, slide_index: int)
     else:
         logger.warning(f"Слайд {slide_index}: Плейсхолдер текста не найден или описание отсутствует")
 
-    picture_placeholder = None
-    for shape in slide.placeholders:
-        if shape.placeholder_format.type == 18:
-            picture_placeholder = shape
-            break
+    picture_placeholder = find_placeholder(slide, 18, info.picture_idx if info else None)
 
     if 'photo' in data and data['photo'] and os.path.exists(data['photo']):
         try:
@@ -75,7 +83,7 @@ def add_template_content_slide(prs: Presentation, data: Dict, slide_index: int)
 
 def add_template_final_slide(prs: Presentation, template_prs: Presentation) -> None:
     if len(template_prs.slides) >= 3:
-        slide_layout = template_prs.slide_layouts[2]
+        slide_layout = template_prs.slide_layouts[FINAL_LAYOUT_INDEX]
         prs.slides.add_slide(slide_layout)
         logger.debug("Последний слайд добавлен из шаблона")
     else:
@@ -116,15 +124,16 @@ def add_slide(prs: Presentation, data: Dict) -> None:
         except Exception as e:
             print(f"Ошибка добавления фото для слайда '{data.get('zagolovok', 'Неизвестно')}': {e}")
 
-def generate_presentation(data: List[Dict], slide_count: int, output_path: str, topic: str, template_mode: bool = False) -> None:
+def build_presentation(data: List[Dict], slide_count: int, topic: str, template_mode: bool = False, template_name: str = DEFAULT_TEMPLATE) -> Optional[Presentation]:
     if not data and not topic:
         print("Нет данных или темы для генерации презентации")
-        return
+        return None
     if template_mode:
-        prs = load_template()
+        prs, info = template_registry.open(template_name)
         add_template_title_slide(prs, topic)
         for i, slide_data in enumerate(data[:slide_count - 2]): 
-            add_template_content_slide(prs, slide_data, i + 1)
+            with span("slide_build"):
+                add_template_content_slide(prs, slide_data, i + 1, info)
         add_template_final_slide(prs, prs)
     else:
         prs = create_presentation(slide_count)
@@ -143,10 +152,30 @@ def generate_presentation(data: List[Dict], slide_count: int, output_path: str,
                 title.width = Inches(10)
                 title.height = Inches(1.5)
         for i, slide_data in enumerate(data[:slide_count - 1]):
-            add_slide(prs, slide_data)
-    
+            with span("slide_build"):
+                add_slide(prs, slide_data)
+    return prs
+
+def generate_presentation(data: List[Dict], slide_count: int, output_path: str, topic: str, template_mode: bool = False, template_name: str = DEFAULT_TEMPLATE) -> None:
+    prs = build_presentation(data, slide_count, topic, template_mode, template_name)
+    if prs is None:
+        return
     try:
-        prs.save(output_path)
+        with span("pptx_save"):
+            prs.save(output_path)
         print(f"Презентация сохранена в {output_path}")
     except Exception as e:
-        print(f"Ошибка сохранения презентации: {e}")
\ No newline at end of file
+        print(f"Ошибка сохранения презентации: {e}")
+
+def generate_presentation_bytes(data: List[Dict], slide_count: int, topic: str, template_mode: bool = False, template_name: str = DEFAULT_TEMPLATE) -> Optional[bytes]:
+    prs = build_presentation(data, slide_count, topic, template_mode, template_name)
+    if prs is None:
+        return None
+    buffer = BytesIO()
+    try:
+        with span("pptx_save"):
+            prs.save(buffer)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения презентации: {e}")
+        return None
+    return buffer.getvalue()
\ No newline at end of file
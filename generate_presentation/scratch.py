@@ -0,0 +1,122 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Set
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+SCRATCH_MAX_BYTES = int(os.environ.get('SCRATCH_MAX_BYTES', str(512 * 1024 * 1024)))
+SCRATCH_TTL = float(os.environ.get('SCRATCH_TTL', '3600'))
+SCRATCH_SWEEP_INTERVAL = float(os.environ.get('SCRATCH_SWEEP_INTERVAL', '300'))
+
+class ScratchSpaceExceeded(Exception):
+    pass
+
+class ScratchDir:
+    def __init__(self, space: "ScratchSpace", path: Path):
+        self.space = space
+        self.path = path
+        self.bytes_used = 0
+
+    def reserve(self, nbytes: int) -> None:
+        self.space.reserve(nbytes)
+        self.bytes_used += nbytes
+
+    def discard(self, path: Path) -> None:
+        # Удаляет файл и производные от него (например, обработанные копии) до окончания запроса
+        for file in [path, *path.parent.glob(f"{path.stem}_*")]:
+            try:
+                size = file.stat().st_size
+                file.unlink()
+            except OSError:
+                continue
+            if file == path:
+                released = min(size, self.bytes_used)
+                self.bytes_used -= released
+                self.space.release(released)
+
+class ScratchSpace:
+    def __init__(self,
+                 root: Path,
+                 max_bytes: int = SCRATCH_MAX_BYTES,
+                 ttl: float = SCRATCH_TTL,
+                 sweep_interval: float = SCRATCH_SWEEP_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.__used = 0
+        self.__active: Set[str] = set()
+        self.__lock = threading.Lock()
+
+    @property
+    def bytes_used(self) -> int:
+        return self.__used
+
+    def reserve(self, nbytes: int) -> None:
+        with self.__lock:
+            if self.__used + nbytes > self.max_bytes:
+                raise ScratchSpaceExceeded(f"Превышен лимит временного хранилища ({self.max_bytes} байт)")
+            self.__used += nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self.__lock:
+            self.__used = max(0, self.__used - nbytes)
+
+    @asynccontextmanager
+    async def request_dir(self) -> AsyncIterator[ScratchDir]:
+        name = uuid.uuid4().hex
+        path = self.root / name
+        path.mkdir(parents=True, exist_ok=True)
+        scratch = ScratchDir(self, path)
+        with self.__lock:
+            self.__active.add(name)
+        try:
+            yield scratch
+        finally:
+            await asyncio.to_thread(shutil.rmtree, path, True)
+            with self.__lock:
+                self.__active.discard(name)
+            self.release(scratch.bytes_used)
+            logger.debug(f"Временный каталог {path} удалён ({scratch.bytes_used} байт)")
+
+    def sweep(self) -> int:
+        if not self.root.exists():
+            return 0
+        deadline = time.time() - self.ttl
+        removed = 0
+        for path in self.root.iterdir():
+            with self.__lock:
+                if path.name in self.__active:
+                    continue
+            try:
+                if path.stat().st_mtime > deadline:
+                    continue
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+                removed += 1
+            except OSError as e:
+                logger.error(f"Ошибка очистки {path}: {e}")
+        if removed:
+            logger.debug(f"Удалено устаревших временных каталогов: {removed}")
+        return removed
+
+    async def run_sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Ошибка очистки временного хранилища: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            return {"bytes_used": self.__used, "max_bytes": self.max_bytes, "active_dirs": len(self.__active)}
@@ -0,0 +1,119 @@
+import argparse
+import os
+import shutil
+import signal
+import socket
+import time
+from types import ModuleType
+from typing import Dict
+import uvicorn
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+WEB_HOST = os.environ.get('WEB_HOST', '127.0.0.1')
+WEB_PORT = int(os.environ.get('WEB_PORT', '8000'))
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', str(os.cpu_count() or 1)))
+WEB_BACKLOG = int(os.environ.get('WEB_BACKLOG', '2048'))
+# Обработчик, упавший быстрее этого времени, перезапускается с задержкой, чтобы не уйти в цикл перезапусков
+WORKER_MIN_UPTIME = 1.0
+
+def preload_app(workers: int) -> ModuleType:
+    started = time.perf_counter()
+    if workers > 1:
+        # Задачу принимает один обработчик, а статус могут запросить у другого
+        os.environ.setdefault('JOB_BACKEND', 'file')
+    from generate_presentation import main
+    main.preload()
+    main.REMOVE_UPLOADS_ON_SHUTDOWN = workers == 1
+    memory = main.metrics.process_memory()
+    logger.info(f"Приложение предзагружено за {time.perf_counter() - started:.3f} с, память: {memory['rss'] / 2**20:.1f} МБ")
+    return main
+
+def run_worker(app_module: ModuleType, config: uvicorn.Config, sock: socket.socket) -> None:
+    app_module.process_started = time.perf_counter()
+    # Обработчики сигналов главного процесса не наследуются: остановкой обработчика управляет uvicorn
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def serve(host: str = WEB_HOST, port: int = WEB_PORT, workers: int = WEB_WORKERS) -> None:
+    workers = max(1, workers)
+    if workers > 1 and not hasattr(os, "fork"):
+        logger.warning("fork недоступен, сервер запускается с одним обработчиком")
+        workers = 1
+    app_module = preload_app(workers)
+    config = uvicorn.Config(app_module.app, host=host, port=port, backlog=WEB_BACKLOG)
+    if workers == 1:
+        uvicorn.Server(config).run()
+        return
+
+    # Сокет открывается до fork и принимает соединения во всех обработчиках
+    sock = config.bind_socket()
+    children: Dict[int, int] = {}
+    started_at: Dict[int, float] = {}
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app_module, config, sock)
+            except BaseException as e:
+                logger.error(f"Обработчик {index} завершился с ошибкой: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+        started_at[pid] = time.monotonic()
+        logger.info(f"Запущен обработчик {index} (pid {pid})")
+        if stopping:
+            os.kill(pid, signal.SIGTERM)
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        uptime = time.monotonic() - started_at.pop(pid, 0.0)
+        if index is None or stopping:
+            continue
+        logger.warning(f"Обработчик {index} (pid {pid}) завершился с кодом {os.waitstatus_to_exitcode(status)}, перезапуск")
+        if uptime < WORKER_MIN_UPTIME:
+            time.sleep(WORKER_MIN_UPTIME)
+        spawn(index)
+
+    sock.close()
+    if app_module.UPLOAD_DIR.exists():
+        shutil.rmtree(app_module.UPLOAD_DIR, ignore_errors=True)
+    logger.info("Сервер остановлен")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Сервер генерации презентаций с несколькими обработчиками")
+    parser.add_argument("--host", default=WEB_HOST)
+    parser.add_argument("--port", type=int, default=WEB_PORT)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="Число процессов-обработчиков")
+    return parser
+
+def main() -> None:
+    args = build_parser().parse_args()
+    serve(args.host, args.port, args.workers)
+
+if __name__ == "__main__":
+    main()
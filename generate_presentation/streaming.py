@@ -0,0 +1,46 @@
+import json
+from typing import Any, Dict, List
+
+SLIDE_KEYS = ("zagolovok", "opisanie")
+
+class SlideStreamParser:
+    def __init__(self):
+        self.__buffer = ""
+        self.__pos = 0
+        self.__in_string = False
+        self.__escape = False
+        self.__object_starts: List[int] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self.__buffer += text
+        slides = []
+        while self.__pos < len(self.__buffer):
+            char = self.__buffer[self.__pos]
+            if self.__in_string:
+                if self.__escape:
+                    self.__escape = False
+                elif char == "\\":
+                    self.__escape = True
+                elif char == '"':
+                    self.__in_string = False
+            elif char == '"':
+                self.__in_string = True
+            elif char == "{":
+                self.__object_starts.append(self.__pos)
+            elif char == "}" and self.__object_starts:
+                start = self.__object_starts.pop()
+                slide = self._parse_slide(self.__buffer[start:self.__pos + 1])
+                if slide is not None:
+                    slides.append(slide)
+            self.__pos += 1
+        return slides
+
+    @staticmethod
+    def _parse_slide(fragment: str):
+        try:
+            obj = json.loads(fragment)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(obj, dict) and all(key in obj for key in SLIDE_KEYS):
+            return obj
+        return None
@@ -0,0 +1,122 @@
+import os
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from loguru import logger
+from pptx import Presentation
+
+load_dotenv()
+# По умолчанию каталог рядом с пакетом, а не относительно рабочего каталога процесса
+TEMPLATES_DIR = Path(os.environ.get('TEMPLATES_DIR', str(Path(__file__).resolve().parent.parent / 'templates')))
+DEFAULT_TEMPLATE = "template"
+
+TITLE_PLACEHOLDER = 1
+BODY_PLACEHOLDER = 7
+PICTURE_PLACEHOLDER = 18
+CONTENT_LAYOUT_INDEX = 1
+FINAL_LAYOUT_INDEX = 2
+
+class TemplateError(ValueError):
+    pass
+
+class TemplateInfo:
+    def __init__(self, name: str, path: Path, data: bytes):
+        self.name = name
+        self.path = path
+        self.data = data
+        self.slide_count = 0
+        self.has_title = False
+        self.title_idx: Optional[int] = None
+        self.body_idx: Optional[int] = None
+        self.picture_idx: Optional[int] = None
+        self.picture_size: Optional[Tuple[int, int]] = None
+        self.has_final = False
+        self.warnings: List[str] = []
+
+def inspect_template(prs: Presentation, info: TemplateInfo) -> TemplateInfo:
+    info.slide_count = len(prs.slides)
+    if info.slide_count < 2:
+        raise TemplateError("Шаблон должен содержать минимум 2 слайда (титульный и основной)")
+    if len(prs.slide_layouts) <= CONTENT_LAYOUT_INDEX:
+        raise TemplateError("Шаблон не содержит макет для основного слайда")
+
+    info.has_title = prs.slides[0].shapes.title is not None
+    if not info.has_title:
+        info.warnings.append("На титульном слайде отсутствует плейсхолдер заголовка")
+
+    for placeholder in prs.slide_layouts[CONTENT_LAYOUT_INDEX].placeholders:
+        placeholder_type = placeholder.placeholder_format.type
+        idx = placeholder.placeholder_format.idx
+        if placeholder_type == TITLE_PLACEHOLDER and info.title_idx is None:
+            info.title_idx = idx
+        elif placeholder_type == BODY_PLACEHOLDER and info.body_idx is None:
+            info.body_idx = idx
+        elif placeholder_type == PICTURE_PLACEHOLDER and info.picture_idx is None:
+            info.picture_idx = idx
+            info.picture_size = (placeholder.width, placeholder.height)
+    if info.title_idx is None:
+        info.warnings.append("В макете основного слайда отсутствует плейсхолдер заголовка")
+    if info.body_idx is None:
+        info.warnings.append("В макете основного слайда отсутствует плейсхолдер текста")
+    if info.picture_idx is None:
+        info.warnings.append("В макете основного слайда отсутствует плейсхолдер изображения")
+
+    info.has_final = info.slide_count > 2
+    if not info.has_final:
+        info.warnings.append("Последний слайд отсутствует, он не будет добавлен")
+    return info
+
+class TemplateRegistry:
+    def __init__(self, directory: Path = TEMPLATES_DIR):
+        self.directory = directory
+        self.__templates: Dict[str, TemplateInfo] = {}
+        self.__loaded = False
+        self.__lock = threading.Lock()
+
+    def _load_file(self, path: Path) -> TemplateInfo:
+        data = path.read_bytes()
+        info = TemplateInfo(path.stem, path, data)
+        inspect_template(Presentation(BytesIO(data)), info)
+        for warning in info.warnings:
+            logger.warning(f"Шаблон {path}: {warning}")
+        return info
+
+    def load(self) -> None:
+        with self.__lock:
+            templates = {}
+            for path in sorted(self.directory.glob("*.pptx")):
+                try:
+                    templates[path.stem] = self._load_file(path)
+                    logger.debug(f"Шаблон загружен: {path}")
+                except Exception as e:
+                    logger.error(f"Шаблон {path} пропущен: {e}")
+            self.__templates = templates
+            self.__loaded = True
+
+    @property
+    def loaded(self) -> bool:
+        return self.__loaded
+
+    def _ensure_loaded(self) -> None:
+        if not self.__loaded:
+            self.load()
+
+    def names(self) -> List[str]:
+        self._ensure_loaded()
+        return list(self.__templates)
+
+    def get(self, name: str = DEFAULT_TEMPLATE) -> TemplateInfo:
+        self._ensure_loaded()
+        info = self.__templates.get(name)
+        if info is None:
+            raise FileNotFoundError(f"Шаблон {name} не найден")
+        return info
+
+    def open(self, name: str = DEFAULT_TEMPLATE) -> Tuple[Presentation, TemplateInfo]:
+        # Шаблон разбирается из байтов в памяти: python-pptx не поддерживает корректное копирование Presentation
+        info = self.get(name)
+        return Presentation(BytesIO(info.data)), info
+
+template_registry = TemplateRegistry()
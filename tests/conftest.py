@@ -0,0 +1,8 @@
+import pytest
+from generate_presentation import main
+
+@pytest.fixture(autouse=True)
+def deck_store_dir(monkeypatch, tmp_path):
+    # Сохранённые презентации не должны оставаться в рабочем каталоге после тестов
+    monkeypatch.setattr(main.deck_store, "root", tmp_path / "decks")
+    return main.deck_store.root
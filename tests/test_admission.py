@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+from fastapi.testclient import TestClient
+from generate_presentation import main
+from generate_presentation.admission import HIGH, LOW, AdmissionController, AdmissionRejected
+
+def run_requests(controller, requests, hold=0.02):
+    order = []
+
+    async def one(client, cost, lane):
+        async with controller.admit(client, cost, lane):
+            order.append(client)
+            await asyncio.sleep(hold)
+
+    async def run():
+        tasks = []
+        for client, cost, lane in requests:
+            tasks.append(asyncio.create_task(one(client, cost, lane)))
+            await asyncio.sleep(0)
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    return order, asyncio.run(run())
+
+def test_fair_queuing_interleaves_clients():
+    controller = AdmissionController(capacity=10)
+    requests = [("heavy", 10, "normal")] * 4 + [("light", 10, "normal")]
+    order, _ = run_requests(controller, requests)
+    # Лёгкий клиент пришёл последним, но обслуживается раньше оставшихся запросов тяжёлого
+    assert order == ["heavy", "heavy", "light", "heavy", "heavy"]
+
+def test_priority_lanes():
+    controller = AdmissionController(capacity=10)
+    requests = [("a", 10, "normal"), ("b", 10, LOW), ("c", 10, "normal"), ("admin", 10, HIGH)]
+    order, _ = run_requests(controller, requests)
+    assert order == ["a", "admin", "c", "b"]
+
+def test_client_identity_and_high_lane_require_trust():
+    controller = AdmissionController(trusted_proxies=["10.0.0.0/8"], priority_tokens=["secret"])
+    headers = {"X-Client-Id": "admin", "X-Priority": "high"}
+    # Заголовки от произвольного клиента не меняют ни идентификатор, ни полосу
+    assert controller.client_for(headers, "203.0.113.5") == "203.0.113.5"
+    assert controller.lane_for(headers, "203.0.113.5") == "normal"
+    assert controller.lane_for({"X-Priority": "low"}, "203.0.113.5") == "low"
+    assert controller.lane_for({**headers, "X-Priority-Token": "guess"}, "203.0.113.5") == "normal"
+    assert controller.lane_for({**headers, "X-Priority-Token": "secret"}, "203.0.113.5") == HIGH
+    # Доверенный прокси сам определяет клиента и его приоритет
+    assert controller.client_for(headers, "10.1.2.3") == "admin"
+    assert controller.lane_for(headers, "10.1.2.3") == HIGH
+    assert controller.client_for({}, "10.1.2.3") == "10.1.2.3"
+
+    controller = AdmissionController(trust_client_header=True)
+    assert controller.client_for(headers, "203.0.113.5") == "admin"
+    assert controller.lane_for(headers, "203.0.113.5") == "normal"
+
+def test_overload_and_timeout_are_rejected():
+    controller = AdmissionController(capacity=10, queue_size=1)
+    _, results = run_requests(controller, [("a", 10, "normal"), ("b", 10, "normal"), ("c", 10, "normal")])
+    assert isinstance(results[2], AdmissionRejected) and results[2].reason == "overload"
+
+    controller = AdmissionController(capacity=10, queue_timeout=0.05)
+    _, results = run_requests(controller, [("a", 10, "normal"), ("b", 10, "normal")], hold=0.2)
+    assert isinstance(results[1], AdmissionRejected) and results[1].reason == "timeout"
+    assert controller.stats()["queued"]["normal"] == 0 and controller.active == 0
+
+def test_timed_out_head_unblocks_queue_and_is_refunded():
+    controller = AdmissionController(capacity=10, queue_timeout=0.1, budget=60, budget_burst=30)
+
+    async def one(client, cost, hold):
+        async with controller.admit(client, cost):
+            await asyncio.sleep(hold)
+        return time.monotonic()
+
+    async def run():
+        running = asyncio.create_task(one("a", 5, 0.5))
+        await asyncio.sleep(0)
+        head = asyncio.create_task(one("b", 10, 0))
+        await asyncio.sleep(0.05)
+        behind = asyncio.create_task(one("b", 5, 0))
+        started = time.monotonic()
+        results = await asyncio.gather(running, head, behind, return_exceptions=True)
+        return started, results
+
+    started, (_, head, behind) = asyncio.run(run())
+    assert isinstance(head, AdmissionRejected) and head.reason == "timeout"
+    # Второй запрос помещается рядом с выполняющимся и допускается сразу после снятия головы очереди
+    assert not isinstance(behind, Exception) and behind - started < 0.2
+    # Списан только выполненный запрос стоимостью 5
+    controller.charge("b", 25)
+
+def test_rate_limit_and_budget():
+    controller = AdmissionController(rate=1, burst=2, budget=60, budget_burst=30)
+    controller.charge("a", 20)
+    try:
+        controller.charge("a", 20)
+    except AdmissionRejected as e:
+        assert e.reason == "budget" and 9 < e.retry_after <= 10
+    else:
+        raise AssertionError("ожидался отказ")
+    controller.charge("b", 1)
+    controller.charge("b", 1)
+    try:
+        controller.charge("b", 1)
+    except AdmissionRejected as e:
+        assert e.reason == "rate"
+    else:
+        raise AssertionError("ожидался отказ")
+
+def test_endpoint_returns_429_and_reports_queue_time(monkeypatch):
+    async def fake_llama_json_async(text, system_prompt="The output is in JSON format"):
+        return [{"zagolovok": "Слайд 1", "opisanie": "Описание 1"}]
+
+    async def fake_generate_images(descriptions, scratch, on_complete=None, **kwargs):
+        return [None for _ in descriptions]
+
+    monkeypatch.setattr(main.llm, "llama_json_async", fake_llama_json_async)
+    monkeypatch.setattr(main.image_client, "generate_images", fake_generate_images)
+    monkeypatch.setattr(main, "admission", AdmissionController(rate=0.1, burst=1))
+
+    client = TestClient(main.app)
+    data = {"request": json.dumps({"topic": "Космос", "slide_count": 2, "use_cache": False})}
+    response = client.post("/generate-from-topic/", data=data, headers={"X-Client-Id": "user"})
+    assert response.status_code == 200
+    assert "queue;dur=" in response.headers["server-timing"]
+    assert "service;dur=" in response.headers["server-timing"]
+
+    # Новый идентификатор в заголовке не обходит лимит: клиент определяется по адресу подключения
+    response = client.post("/generate-from-topic/", data=data, headers={"X-Client-Id": "other"})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["retry-after"]) <= 10
+
+    monkeypatch.setattr(main, "admission", AdmissionController(rate=0.1, burst=1, trust_client_header=True))
+    assert client.post("/generate-from-topic/", data=data, headers={"X-Client-Id": "user"}).status_code == 200
+    assert client.post("/generate-from-topic/", data=data, headers={"X-Client-Id": "user"}).status_code == 429
+    assert client.post("/generate-from-topic/", data=data, headers={"X-Client-Id": "other"}).status_code == 200
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+from generate_presentation import main
+from generate_presentation.backends import BackendClient, BackendHTTPError, CircuitBreaker, CircuitOpenError
+from generate_presentation.images import ImageClient
+
+def test_transient_errors_are_retried():
+    backend = BackendClient("test", deadline=5, retries=2, base_delay=0)
+    attempts = 0
+
+    async def flaky():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise BackendHTTPError("test", 503)
+        return "ok"
+
+    assert asyncio.run(backend.call(flaky)) == "ok"
+    assert attempts == 3
+    assert backend.stats()["retried"] == 2
+    assert backend.breaker.state == "closed"
+
+def test_client_errors_are_not_retried():
+    backend = BackendClient("test", deadline=5, retries=2, base_delay=0)
+    attempts = 0
+
+    async def bad_request():
+        nonlocal attempts
+        attempts += 1
+        raise BackendHTTPError("test", 400)
+
+    with pytest.raises(BackendHTTPError):
+        asyncio.run(backend.call(bad_request))
+    assert attempts == 1
+
+def test_deadline_bounds_all_attempts():
+    backend = BackendClient("test", deadline=0.2, retries=5, base_delay=0)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    started = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(backend.call(slow))
+    assert time.perf_counter() - started < 0.5
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.1)
+    backend = BackendClient("test", deadline=5, retries=0, breaker=breaker)
+
+    async def down():
+        raise BackendHTTPError("test", 502)
+
+    async def up():
+        return "ok"
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(BackendHTTPError):
+                await backend.call(down)
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await backend.call(up)
+        await asyncio.sleep(0.15)
+        assert breaker.state == "half_open"
+        return await backend.call(up)
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == "closed"
+
+def test_open_image_breaker_degrades_to_no_image():
+    client = ImageClient(api_url="http://127.0.0.1:9/llm_tools/image_generate", timeout=5)
+    client.backend = BackendClient("image", deadline=5, retries=0, breaker=CircuitBreaker("image", failure_threshold=1, reset_timeout=60))
+
+    async def run():
+        async with main.scratch_space.request_dir() as scratch:
+            first = await client.generate_image("a", 0, scratch, use_cache=False)
+            started = time.perf_counter()
+            second = await client.generate_image("b", 1, scratch, use_cache=False)
+            elapsed = time.perf_counter() - started
+        await client.close()
+        return first, second, elapsed
+
+    first, second, elapsed = asyncio.run(run())
+    assert first is None and second is None
+    assert client.backend.breaker.state == "open"
+    assert elapsed < 0.05
+
+def test_open_llm_breaker_returns_503(monkeypatch):
+    breaker = CircuitBreaker("llm", failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    monkeypatch.setattr(main.llm.backend, "breaker", breaker)
+
+    client = TestClient(main.app)
+    data = {"topic": "Космос", "slide_count": 3, "use_cache": False}
+    response = client.post("/generate-from-topic/", data={"request": json.dumps(data)})
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) > 0
+    assert client.get("/backends/stats").json()["llm"]["breaker"]["state"] == "open"
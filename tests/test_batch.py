@@ -0,0 +1,96 @@
+import asyncio
+import io
+import json
+import zipfile
+from fastapi.testclient import TestClient
+from generate_presentation import main
+from generate_presentation.admission import AdmissionController
+
+def test_batch_dedupes_topics_and_images(monkeypatch):
+    llm_calls = []
+    image_calls = []
+
+    async def fake_llama_json_async(text, system_prompt="The output is in JSON format"):
+        llm_calls.append(text)
+        await asyncio.sleep(0.01)
+        return [{"zagolovok": "Слайд 1", "opisanie": "Общее описание"}, {"zagolovok": "Слайд 2", "opisanie": f"Описание {len(llm_calls)}"}]
+
+    async def fake_generate_image(description, slide_index, scratch, use_cache=True):
+        image_calls.append(description)
+        await asyncio.sleep(0.01)
+        return None
+
+    monkeypatch.setattr(main.llm, "llama_json_async", fake_llama_json_async)
+    monkeypatch.setattr(main.image_client, "generate_image", fake_generate_image)
+
+    requests = [
+        {"topic": "Космос", "slide_count": 3, "output_path": "a.pptx", "use_cache": False},
+        {"topic": "  космос ", "slide_count": 3, "output_path": "b.pptx", "use_cache": False},
+        {"topic": "Океан", "slide_count": 3, "output_path": "c.pptx", "use_cache": False},
+    ]
+    response = TestClient(main.app).post("/generate-batch/", data={"requests": json.dumps(requests)})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    manifest = json.loads(archive.read("manifest.json"))
+    assert [result["filename"] for result in manifest["results"]] == ["001_a.pptx", "002_b.pptx", "003_c.pptx"]
+    assert all(archive.read(result["filename"])[:2] == b"PK" for result in manifest["results"])
+    assert len(llm_calls) == 2
+    assert manifest["stats"]["llm_requests_saved"] == 1
+    assert sorted(image_calls) == sorted(set(image_calls))
+    assert manifest["stats"]["unique_images"] == len(image_calls)
+
+def test_batch_items_share_admission_capacity(monkeypatch):
+    running = []
+    peak = []
+
+    async def fake_llama_json_async(text, system_prompt="The output is in JSON format"):
+        running.append(text)
+        peak.append(len(running))
+        await asyncio.sleep(0.02)
+        running.remove(text)
+        return [{"zagolovok": "Слайд 1", "opisanie": text}, {"zagolovok": "Слайд 2", "opisanie": "Описание"}]
+
+    async def fake_generate_image(description, slide_index, scratch, use_cache=True):
+        return None
+
+    monkeypatch.setattr(main.llm, "llama_json_async", fake_llama_json_async)
+    monkeypatch.setattr(main.image_client, "generate_image", fake_generate_image)
+    # Ёмкости хватает ровно на одну презентацию из трёх слайдов
+    monkeypatch.setattr(main, "admission", AdmissionController(capacity=5))
+
+    requests = [{"topic": topic, "slide_count": 3, "use_cache": False} for topic in ("Космос", "Океан", "Горы")]
+    response = TestClient(main.app).post("/generate-batch/", data={"requests": json.dumps(requests)})
+    assert response.headers["x-batch-succeeded"] == "3"
+    assert max(peak) == 1
+    assert main.admission.stats()["admitted"] == 3
+
+def test_batch_rejects_invalid_items():
+    requests = [{"topic": "Космос", "slide_count": 2, "template_mode": True}]
+    response = TestClient(main.app).post("/generate-batch/", data={"requests": json.dumps(requests)})
+    assert response.status_code == 422
+
+def test_released_image_keeps_shared_processing_dict(monkeypatch):
+    async def fake_generate_image(description, slide_index, scratch, use_cache=True):
+        path = scratch.path / f"{description}.png"
+        path.write_bytes(b"png")
+        return str(path)
+
+    monkeypatch.setattr(main.image_client, "generate_image", fake_generate_image)
+
+    async def run():
+        async with main.scratch_space.request_dir() as scratch:
+            context = main.BatchContext(scratch)
+            shared = context.processing
+            first = await context.image("a", False)
+            second = await context.image("b", False)
+            shared[(first, 1)] = "обработка a"
+            shared[(second, 1)] = "обработка b"
+            context.release_image("a", False)
+            return context.processing is shared, dict(shared), second
+
+    same, remaining, second = asyncio.run(run())
+    # Собирающиеся презентации держат ссылку на прежний словарь и продолжают видеть общие задачи
+    assert same
+    assert remaining == {(second, 1): "обработка b"}
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import httpx
+import pytest
+from benchmarks.fake_backends import FakeBackends
+from benchmarks.run import compare, percentile, run_suite
+from generate_presentation import main
+from generate_presentation.images import ImageClient
+from generate_presentation.llm import LLM
+
+@pytest.fixture
+def fakes():
+    backends = FakeBackends(llm_latency=0, token_rate=100000, words_per_slide=5, image_latency=0, image_size=16).start_in_thread()
+    yield backends
+    backends.stop_thread()
+
+def test_fake_llm_speaks_openai_json_and_stream(fakes):
+    llm = LLM(base_url=fakes.llm_url)
+    prompt = "Количество слайдов: 3"
+
+    async def run():
+        slides = await llm.llama_json_async(prompt)
+        streamed = "".join([token async for token in llm.llama_generator(prompt)])
+        return slides, streamed
+
+    slides, streamed = asyncio.run(run())
+    assert [slide["zagolovok"] for slide in slides] == ["Слайд 1", "Слайд 2", "Слайд 3"]
+    assert '"zagolovok": "Слайд 3"' in streamed
+
+def test_fake_image_api_returns_unique_files(fakes, tmp_path):
+    client = ImageClient(api_url=fakes.image_url)
+
+    async def run():
+        async with main.scratch_space.request_dir() as scratch:
+            paths = await client.generate_images(["a", "b"], scratch, use_cache=False)
+            contents = [open(path, "rb").read() for path in paths]
+        await client.close()
+        return contents
+
+    first, second = asyncio.run(run())
+    assert first.startswith(b"\x89PNG") and first != second
+
+def test_suite_runs_against_fakes(fakes, monkeypatch):
+    monkeypatch.setattr(main, "llm", LLM(base_url=fakes.llm_url))
+    monkeypatch.setattr(main, "image_client", ImageClient(api_url=fakes.image_url))
+    args = argparse.Namespace(slide_count=3, slide_counts=[3, 5], clients=[2], requests=2, rounds=1, stream=True, template=False)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            results = await run_suite(client, args, in_process=True)
+        await main.image_client.close()
+        return results
+
+    results = asyncio.run(run())
+    assert results["latency"]["latency"]["count"] == 2
+    assert results["throughput"][0]["errors"] == 0
+    assert results["slides"][1]["deck_bytes"] > results["slides"][0]["deck_bytes"]
+    assert all(run["peak_traced_bytes"] for run in results["slides"])
+
+def test_percentile_and_compare():
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([], 95) is None
+    baseline = {"latency": {"latency": {"p50": 1.0}}, "throughput": [{"clients": 4, "throughput_rps": 2.0, "latency": {"p50": None, "p95": None, "p99": None}}], "slides": []}
+    current = {"latency": {"latency": {"p50": 2.0}}, "throughput": [{"clients": 4, "throughput_rps": 4.0, "latency": {"p50": None, "p95": None, "p99": None}}], "slides": []}
+    lines = compare(current, baseline)
+    assert "хуже" in lines[0] and "лучше" in lines[1]
@@ -0,0 +1,58 @@
+import asyncio
+from generate_presentation.cache import TieredCache, make_key, normalize_text
+
+def test_make_key_normalizes_topic():
+    assert make_key("slides", normalize_text("  Космос\n и  звёзды ")) == make_key("slides", normalize_text("космос и звёзды"))
+    assert make_key("image", "a", 768, 768) != make_key("image", "a", 512, 512)
+
+def test_memory_and_disk_tiers(tmp_path):
+    cache = TieredCache("test", tmp_path, memory_max_bytes=10, disk_max_bytes=1024)
+    cache.set("k1", b"12345")
+    cache.set("k2", b"67890")
+    cache.set("k3", b"abcde")
+    assert cache.get("k3") == b"abcde"
+    assert cache.get("k1") == b"12345"
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["disk_hits"] == 1
+    assert stats["misses"] == 1
+
+def test_disk_tier_is_size_bounded(tmp_path):
+    cache = TieredCache("test", tmp_path, memory_max_bytes=0, disk_max_bytes=25)
+    for i in range(5):
+        cache.set(f"key{i}", b"x" * 10)
+    assert cache.stats()["disk_bytes"] <= 25
+    assert cache.stats()["evictions"] == 3
+    assert cache.get("key4") == b"x" * 10
+
+def test_disk_index_evicts_least_recently_used(tmp_path):
+    cache = TieredCache("test", tmp_path, memory_max_bytes=0, disk_max_bytes=30)
+    for i in range(3):
+        cache.set(f"key{i}", b"x" * 10)
+    assert cache.get("key0") == b"x" * 10
+    cache.set("key3", b"x" * 10)
+    # Вытеснен давно не читавшийся key1, а не записанный первым key0
+    assert cache.get("key1") is None
+    assert cache.get("key0") == b"x" * 10
+    assert cache.stats()["disk_items"] == 3
+
+    # Новый экземпляр восстанавливает индекс с диска
+    reopened = TieredCache("test", tmp_path, memory_max_bytes=0, disk_max_bytes=30)
+    reopened.set("key4", b"x" * 10)
+    assert reopened.stats()["disk_bytes"] == 30
+    assert len(list(tmp_path.glob("*/*"))) == 3
+
+def test_async_wrappers(tmp_path):
+    cache = TieredCache("test", tmp_path, memory_max_bytes=1024, disk_max_bytes=1024)
+
+    async def run():
+        await cache.aset_json("k", {"a": 1})
+        from_memory = await cache.aget_json("k")
+        fresh = TieredCache("test", tmp_path, memory_max_bytes=1024, disk_max_bytes=1024)
+        return from_memory, await fresh.aget_json("k"), await fresh.aget("missing"), fresh.stats()
+
+    from_memory, from_disk, missing, stats = asyncio.run(run())
+    assert from_memory == from_disk == {"a": 1}
+    assert missing is None
+    assert stats["disk_hits"] == 1 and stats["misses"] == 1
@@ -0,0 +1,125 @@
+import json
+from PIL import Image
+from fastapi.testclient import TestClient
+from generate_presentation import main
+from generate_presentation.decks import DeckStore, StaleDeckError
+from generate_presentation.models import GenerateRequest
+from generate_presentation.outline import SLIDE_SYSTEM_PROMPT
+
+def setup_fakes(monkeypatch):
+    calls = {"llm": [], "images": []}
+
+    async def fake_llama_json_async(text, system_prompt="The output is in JSON format"):
+        calls["llm"].append(system_prompt)
+        if system_prompt == SLIDE_SYSTEM_PROMPT:
+            return {"opisanie": "Переписанное описание"}
+        return [{"zagolovok": f"Слайд {i}", "opisanie": f"Описание {i}"} for i in range(1, 4)]
+
+    async def fake_generate_image(description, slide_index, scratch, use_cache=True):
+        calls["images"].append((description, use_cache))
+        path = scratch.path / f"slide_{slide_index}.png"
+        Image.new("RGB", (64, 64), (slide_index * 40, 0, 0)).save(path)
+        return str(path)
+
+    monkeypatch.setattr(main.llm, "llama_json_async", fake_llama_json_async)
+    monkeypatch.setattr(main.image_client, "generate_image", fake_generate_image)
+    return calls
+
+def regenerate(client, deck_id, **request):
+    return client.post(f"/decks/{deck_id}/regenerate/", data={"request": json.dumps(request)})
+
+def test_regeneration_rebuilds_only_changed_slides(monkeypatch):
+    calls = setup_fakes(monkeypatch)
+    client = TestClient(main.app)
+    data = {"topic": "Космос", "slide_count": 4, "use_cache": False}
+    # Без keep_deck презентация не сохраняется
+    assert "x-deck-id" not in client.post("/generate-from-topic/", data={"request": json.dumps(data)}).headers
+    calls["images"].clear()
+    calls["llm"].clear()
+    data["keep_deck"] = True
+    response = client.post("/generate-from-topic/", data={"request": json.dumps(data)})
+    assert response.status_code == 200
+    deck_id = response.headers["x-deck-id"]
+    assert len(calls["images"]) == 3 and len(calls["llm"]) == 1
+
+    stored = client.get(f"/decks/{deck_id}").json()
+    assert [slide["zagolovok"] for slide in stored["slides"]] == ["Слайд 1", "Слайд 2", "Слайд 3"]
+    assert all(slide["photo"] for slide in stored["slides"])
+
+    # Новый заголовок не требует нового изображения, новое описание — требует
+    response = regenerate(client, deck_id, edits=[{"index": 0, "zagolovok": "Начало"}, {"index": 1, "opisanie": "Новое описание"}])
+    assert response.status_code == 200
+    assert response.content[:2] == b"PK"
+    assert response.headers["x-regenerated-slides"] == "1"
+    assert calls["images"][3:] == [("Новое описание", False)]
+    assert len(calls["llm"]) == 1
+
+    response = regenerate(client, deck_id, use_cache=True, edits=[{"index": 2, "regenerate_text": True}, {"index": 0, "regenerate_image": True}])
+    assert response.headers["x-regenerated-slides"] == "0,2"
+    assert calls["llm"][1:] == [SLIDE_SYSTEM_PROMPT]
+    assert sorted(calls["images"][4:]) == [("Описание 1", False), ("Переписанное описание", True)]
+
+    stored = client.get(f"/decks/{deck_id}").json()
+    assert [slide["opisanie"] for slide in stored["slides"]] == ["Описание 1", "Новое описание", "Переписанное описание"]
+
+    # Переставленные слайды сохраняют изображения, пути изображений от клиента игнорируются
+    slides = [{**stored["slides"][1], "photo": "/etc/passwd"}, stored["slides"][0], stored["slides"][2]]
+    response = regenerate(client, deck_id, presentation={"slides": slides, "slide_count": 4, "output_path": "Доклад.pptx"})
+    assert response.status_code == 200
+    assert response.headers["x-regenerated-slides"] == ""
+    assert len(calls["images"]) == 6
+    photos = [slide["photo"] for slide in client.get(f"/decks/{deck_id}").json()["slides"]]
+    assert photos[0] == stored["slides"][1]["photo"]
+
+def test_regeneration_errors(monkeypatch):
+    setup_fakes(monkeypatch)
+    client = TestClient(main.app)
+    assert regenerate(client, "missing", edits=[]).status_code == 404
+    assert regenerate(client, "..", edits=[]).status_code == 404
+
+    data = {"topic": "Космос", "slide_count": 4, "use_cache": False, "keep_deck": True}
+    deck_id = client.post("/generate-from-topic/", data={"request": json.dumps(data)}).headers["x-deck-id"]
+    assert regenerate(client, deck_id, edits=[{"index": 3, "opisanie": "?"}]).status_code == 422
+    slides = [{"zagolovok": "Один", "opisanie": "Один"}]
+    assert regenerate(client, deck_id, presentation={"slides": slides, "slide_count": 4}).status_code == 422
+
+def test_stale_regeneration_is_rejected(monkeypatch):
+    setup_fakes(monkeypatch)
+    client = TestClient(main.app)
+    data = {"topic": "Космос", "slide_count": 4, "use_cache": False, "keep_deck": True}
+    deck_id = client.post("/generate-from-topic/", data={"request": json.dumps(data)}).headers["x-deck-id"]
+    base = main.deck_store.load(deck_id)
+
+    # Другой запрос успел сохранить свою правку после того, как эта загрузила презентацию
+    original = main.deck_store.aload
+
+    async def load_then_race(deck_id):
+        stored = await original(deck_id)
+        slides = [{"zagolovok": slide.zagolovok, "opisanie": slide.opisanie} for slide in stored.slides]
+        main.deck_store.save(deck_id, stored.request, slides, stored.created_at, stored.version)
+        return stored
+
+    monkeypatch.setattr(main.deck_store, "aload", load_then_race)
+    assert regenerate(client, deck_id, edits=[{"index": 0, "zagolovok": "Начало"}]).status_code == 409
+    stored = main.deck_store.load(deck_id)
+    assert stored.version == base.version + 1
+    assert stored.slides[0].zagolovok == "Слайд 1"
+
+def test_store_is_bounded_and_versioned(tmp_path):
+    store = DeckStore(root=tmp_path, max_bytes=2500)
+    request = GenerateRequest(topic="Космос", slide_count=3)
+    for i in range(3):
+        photo = tmp_path / f"photo{i}.png"
+        photo.write_bytes(b"x" * 1000)
+        store.save(f"deck{i}", request, [{"zagolovok": "Слайд", "opisanie": "Описание", "photo": str(photo)}])
+        photo.unlink()
+    assert store.save("deck2", request, [], base_version=1).version == 2
+    try:
+        store.save("deck2", request, [], base_version=1)
+    except StaleDeckError:
+        pass
+    else:
+        raise AssertionError("ожидался отказ")
+
+    assert store.sweep() == 1
+    assert store.load("deck0") is None and store.load("deck1") is not None
@@ -0,0 +1,35 @@
+import asyncio
+import os
+from PIL import Image
+from generate_presentation.image_processing import DEFAULT_PICTURE_SIZE, ImageProcessor, process_image, target_pixels
+
+def make_png(path, size=(768, 768)):
+    Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3)).save(path, "PNG")
+
+def test_target_pixels_follow_dpi():
+    assert target_pixels(DEFAULT_PICTURE_SIZE, 150) == (450, 450)
+    assert target_pixels(DEFAULT_PICTURE_SIZE, 96) == (288, 288)
+
+def test_process_image_downscales_and_recompresses(tmp_path):
+    source = tmp_path / "slide_0.png"
+    make_png(source)
+    path, before, after = process_image(str(source), (450, 300), "jpeg", 80)
+    assert path.endswith(".jpg")
+    assert after < before
+    with Image.open(path) as img:
+        assert img.size == (450, 450)
+
+def test_processor_updates_slides_in_process_pool(tmp_path):
+    slides = []
+    for i in range(3):
+        make_png(tmp_path / f"slide_{i}.png", (256, 256))
+        slides.append({"zagolovok": str(i), "opisanie": "", "photo": str(tmp_path / f"slide_{i}.png")})
+    slides.append({"zagolovok": "без фото", "opisanie": ""})
+    processor = ImageProcessor(workers=2, dpi=50)
+    try:
+        stats = asyncio.run(processor.process_slides(slides))
+    finally:
+        processor.shutdown()
+    assert stats["images"] == 3
+    assert stats["bytes_after"] < stats["bytes_before"]
+    assert all(slide["photo"].endswith(".jpg") for slide in slides[:3])
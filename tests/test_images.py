@@ -0,0 +1,65 @@
+import asyncio
+from pathlib import Path
+import pytest
+from generate_presentation.images import ImageClient
+from generate_presentation.scratch import ScratchSpace, ScratchSpaceExceeded
+
+def test_generate_images_bounded_concurrency(tmp_path: Path):
+    client = ImageClient(concurrency=2, timeout=1)
+    active = 0
+    peak = 0
+
+    async def fake_fetch(description, slide_index, scratch):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        if description == "fail":
+            raise RuntimeError("boom")
+        return f"slide_{slide_index}.png"
+
+    client._fetch_image = fake_fetch
+    async def run():
+        async with ScratchSpace(tmp_path).request_dir() as scratch:
+            return await client.generate_images(["a", "fail", "b", "c"], scratch)
+
+    paths = asyncio.run(run())
+    assert paths == ["slide_0.png", None, "slide_2.png", "slide_3.png"]
+    assert peak == 2
+
+def test_generate_image_timeout(tmp_path: Path):
+    client = ImageClient(concurrency=1, timeout=0.05)
+
+    async def slow_fetch(description, slide_index, scratch):
+        await asyncio.sleep(1)
+        return "never.png"
+
+    client._fetch_image = slow_fetch
+    async def run():
+        async with ScratchSpace(tmp_path).request_dir() as scratch:
+            return await client.generate_images(["a"], scratch)
+
+    assert asyncio.run(run()) == [None]
+
+def test_scratch_dirs_are_isolated_bounded_and_removed(tmp_path: Path):
+    space = ScratchSpace(tmp_path, max_bytes=10)
+
+    async def run():
+        async with space.request_dir() as first, space.request_dir() as second:
+            assert first.path != second.path
+            first.reserve(6)
+            (first.path / "slide_0.png").write_bytes(b"x" * 6)
+            with pytest.raises(ScratchSpaceExceeded):
+                second.reserve(6)
+            return first.path
+
+    path = asyncio.run(run())
+    assert not path.exists()
+    assert space.bytes_used == 0
+
+def test_sweeper_removes_stale_dirs(tmp_path: Path):
+    space = ScratchSpace(tmp_path, ttl=0)
+    (tmp_path / "stale").mkdir()
+    assert space.sweep() == 1
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from fastapi.testclient import TestClient
+from generate_presentation import main
+from generate_presentation.jobs import InMemoryJobBackend, JobManager, QueueFullError
+from generate_presentation.models import GenerateRequest, JobStatus
+
+def test_job_submit_poll_and_download(monkeypatch, tmp_path):
+    async def fake_llama_json_async(text, system_prompt="The output is in JSON format"):
+        await asyncio.sleep(0.05)
+        return [{"zagolovok": "Слайд 1", "opisanie": "Описание 1"}, {"zagolovok": "Слайд 2", "opisanie": "Описание 2"}]
+
+    async def fake_generate_images(descriptions, scratch, on_complete=None, **kwargs):
+        for i in range(len(descriptions)):
+            on_complete(i + 1, len(descriptions))
+        return [None for _ in descriptions]
+
+    monkeypatch.setattr(main.llm, "llama_json_async", fake_llama_json_async)
+    monkeypatch.setattr(main.image_client, "generate_images", fake_generate_images)
+    monkeypatch.setattr(main.job_manager, "results_dir", tmp_path)
+
+    with TestClient(main.app) as client:
+        data = {"topic": "Космос", "slide_count": 3, "use_cache": False}
+        response = client.post("/jobs/", data={"request": json.dumps(data)})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            job = client.get(f"/jobs/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                break
+            time.sleep(0.05)
+        assert job["status"] == "done"
+        assert job["progress"]["images"] == {"done": 2, "total": 2}
+
+        result = client.get(f"/jobs/{job_id}/result")
+        assert result.status_code == 200
+        assert result.content[:2] == b"PK"
+
+    assert client.get("/jobs/unknown").status_code == 404
+
+def test_job_queue_full_and_eviction(tmp_path):
+    started = asyncio.Event()
+
+    async def blocking_runner(gen_request, output_path, report):
+        started.set()
+        await asyncio.sleep(10)
+
+    async def run():
+        manager = JobManager(blocking_runner, results_dir=tmp_path, max_concurrent=1, queue_size=1, result_ttl=0)
+        request = GenerateRequest(topic="Космос", slide_count=3)
+        first = await manager.submit(request)
+        await started.wait()
+        await manager.submit(request)
+        try:
+            await manager.submit(request)
+            raise AssertionError("ожидалось переполнение очереди")
+        except QueueFullError:
+            pass
+        job = await manager.get(first.job_id)
+        assert job.status == JobStatus.running
+        job.expires_at = 0
+        assert await manager.evict_expired() == 1
+        assert await manager.get(first.job_id) is None
+        await manager.stop()
+
+    asyncio.run(run())
+
+def test_progress_saves_are_coalesced(tmp_path):
+    saved = []
+
+    class SlowBackend(InMemoryJobBackend):
+        async def save(self, job):
+            saved.append((job.status, dict(job.progress)))
+            await asyncio.sleep(0.01)
+            await super().save(job)
+
+    async def runner(gen_request, output_path, report):
+        for i in range(50):
+            report("images", done=i + 1, total=50)
+        await asyncio.sleep(0)
+        Path(output_path).write_bytes(b"PK")
+
+    async def run():
+        manager = JobManager(runner, backend=SlowBackend(), results_dir=tmp_path)
+        await manager.submit(GenerateRequest(topic="Космос", slide_count=3))
+        while saved[-1][0] not in (JobStatus.done, JobStatus.failed):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        await manager.stop()
+
+    asyncio.run(run())
+    progress = [progress for status, progress in saved if status == JobStatus.running and progress]
+    # 50 отчётов сохраняются не более чем двумя записями, последняя из них — до итогового статуса
+    assert len(progress) <= 2
+    assert progress[-1]["images"]["done"] == 50
+    assert saved[-1][0] == JobStatus.done
@@ -0,0 +1,124 @@
+import asyncio
+import time
+import pytest
+from benchmarks.fake_backends import FakeBackends
+from generate_presentation.llm import LLM
+from generate_presentation.backends import BackendHTTPError
+from generate_presentation.llm_pool import EndpointPool
+
+@pytest.fixture
+def servers():
+    fast = FakeBackends(llm_latency=0.01, token_rate=100000, words_per_slide=5, image_size=16).start_in_thread()
+    slow = FakeBackends(llm_latency=0.5, token_rate=100000, words_per_slide=5, image_size=16).start_in_thread()
+    yield fast, slow
+    fast.stop_thread()
+    slow.stop_thread()
+
+def completion(endpoint):
+    return endpoint.aclient().chat.completions.create(model="Llama3", messages=[{"role": "user", "content": "Количество слайдов: 1"}])
+
+def test_least_outstanding_spreads_load(servers):
+    fast, slow = servers
+    llm = LLM(base_url=f"{fast.llm_url},{fast.llm_url.replace('127.0.0.1', 'localhost')}")
+
+    async def run():
+        return await asyncio.gather(*(llm.llama_json_async("Количество слайдов: 2") for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert all(len(slides) == 2 for slides in results)
+    assert [endpoint.requests for endpoint in llm.pool.endpoints] == [2, 2]
+
+def test_latency_balancing_prefers_fast_endpoint(servers):
+    fast, slow = servers
+    pool = EndpointPool([slow.llm_url, fast.llm_url], concurrency=4, timeout=5, balancing="latency")
+
+    async def run():
+        for _ in range(6):
+            await pool.call(completion)
+
+    asyncio.run(run())
+    slow_endpoint, fast_endpoint = pool.endpoints
+    assert slow_endpoint.requests == 1
+    assert fast_endpoint.requests == 5
+
+def test_hedged_request_answers_from_second_endpoint(servers):
+    fast, slow = servers
+    pool = EndpointPool([fast.llm_url, slow.llm_url], concurrency=4, timeout=5, balancing="latency", hedging=True, hedge_min_samples=3)
+    fast_endpoint, slow_endpoint = pool.endpoints
+
+    async def run():
+        slow_endpoint.healthy = False
+        for _ in range(3):
+            await pool.call(completion)
+        slow_endpoint.healthy = True
+        # Быстрый сервер искусственно выглядит медленным, чтобы основным стал медленный
+        fast_endpoint.ewma = 10.0
+        started = time.perf_counter()
+        endpoint, _ = await pool.call(completion)
+        return endpoint, time.perf_counter() - started
+
+    endpoint, elapsed = asyncio.run(run())
+    assert endpoint is fast_endpoint
+    assert pool.hedged == 1 and pool.hedge_wins == 1
+    assert elapsed < 0.4
+    assert slow_endpoint.outstanding == 0
+
+def test_health_check_removes_dead_and_slow_endpoints(servers):
+    fast, slow = servers
+    pool = EndpointPool([fast.llm_url, "http://127.0.0.1:9/v1"], concurrency=4, timeout=5, health_timeout=1)
+
+    asyncio.run(pool.check_health())
+    live, dead = pool.endpoints
+    assert live.healthy and not dead.healthy
+    assert all(pool.choose() is live for _ in range(3))
+
+    pool = EndpointPool(["http://a/v1", "http://b/v1", "http://c/v1"], concurrency=4, timeout=5, slow_factor=3)
+    for endpoint, latency in zip(pool.endpoints, (0.1, 0.12, 1.0)):
+        endpoint.ewma = latency
+    pool.mark_slow()
+    assert [endpoint.healthy for endpoint in pool.endpoints] == [True, True, False]
+
+def test_generator_uses_pool(servers):
+    fast, slow = servers
+    llm = LLM(base_url=f"{slow.llm_url},{fast.llm_url}")
+    llm.pool.endpoints[0].healthy = False
+
+    async def run():
+        return "".join([token async for token in llm.llama_generator("Количество слайдов: 2")])
+
+    assert '"zagolovok": "Слайд 2"' in asyncio.run(run())
+    assert [endpoint.requests for endpoint in llm.pool.endpoints] == [0, 1]
+
+def test_endpoint_returns_to_rotation_after_transient_failure(servers):
+    fast, slow = servers
+    pool = EndpointPool(["http://a/v1", "http://b/v1"], concurrency=4, timeout=5, failure_cooldown=0.2)
+    a, b = pool.endpoints
+    a.record_result(BackendHTTPError("llm", 503, "недоступен"))
+    assert a.breaker.failures == 1
+    # Сразу после ошибки повтор уходит на другой сервер
+    assert all(pool.choose() is b for _ in range(10))
+
+    time.sleep(0.25)
+    b.outstanding = 1
+    picks = [pool.choose() for _ in range(50)]
+    assert picks.count(a) == 50
+
+    # Успешная проверка состояния сбрасывает счётчик ошибок
+    pool = EndpointPool([fast.llm_url, "http://b/v1"], concurrency=4, timeout=5, health_timeout=1)
+    live = pool.endpoints[0]
+    live.record_result(BackendHTTPError("llm", 503, "недоступен"))
+    asyncio.run(pool.check_endpoint(live))
+    assert live.breaker.failures == 0 and not live.recently_failed(pool.failure_cooldown)
+    assert pool.choose() is live
+
+def test_half_open_endpoint_gets_single_probe():
+    pool = EndpointPool(["http://a/v1", "http://b/v1"], concurrency=4, timeout=5, failure_cooldown=0)
+    a, b = pool.endpoints
+    a.breaker.reset_timeout = 0
+    for _ in range(a.breaker.failure_threshold):
+        a.record_result(BackendHTTPError("llm", 503, "недоступен"))
+    b.outstanding = 5
+    assert pool.choose() is a
+    assert pool.choose() is b
+    a.record_result(None)
+    assert a.breaker.state == "closed" and pool.choose() is a
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import time
+import httpx
+from generate_presentation import main
+
+LLM_DELAY = 0.3
+IMAGE_DELAY = 0.2
+CONCURRENT_REQUESTS = 5
+
+def test_concurrent_requests_overlap(monkeypatch, tmp_path):
+    active = 0
+    peak = 0
+
+    async def fake_llama_json_async(text, system_prompt="The output is in JSON format"):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(LLM_DELAY)
+        active -= 1
+        return [{"zagolovok": "Слайд 1", "opisanie": "Описание 1"}, {"zagolovok": "Слайд 2", "opisanie": "Описание 2"}]
+
+    async def fake_generate_images(descriptions, scratch, on_complete=None, **kwargs):
+        await asyncio.sleep(IMAGE_DELAY)
+        return [None for _ in descriptions]
+
+    monkeypatch.setattr(main.llm, "llama_json_async", fake_llama_json_async)
+    monkeypatch.setattr(main.image_client, "generate_images", fake_generate_images)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def one(i):
+                data = {"topic": "Космос", "slide_count": 3, "output_path": str(tmp_path / f"load_{i}.pptx"), "use_cache": False}
+                return await client.post("/generate-from-topic/", data={"request": json.dumps(data)})
+            return await asyncio.gather(*(one(i) for i in range(CONCURRENT_REQUESTS)))
+
+    started = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+
+    assert all(response.status_code == 200 for response in responses)
+    assert peak == CONCURRENT_REQUESTS
+    assert elapsed < CONCURRENT_REQUESTS * (LLM_DELAY + IMAGE_DELAY) / 2
+
+def test_deck_is_streamed_without_touching_output_path(monkeypatch, tmp_path):
+    async def fake_llama_json_async(text, system_prompt="The output is in JSON format"):
+        return [{"zagolovok": "Слайд 1", "opisanie": "Описание 1"}]
+
+    async def fake_generate_images(descriptions, scratch, on_complete=None, **kwargs):
+        return [None for _ in descriptions]
+
+    monkeypatch.setattr(main.llm, "llama_json_async", fake_llama_json_async)
+    monkeypatch.setattr(main.image_client, "generate_images", fake_generate_images)
+    monkeypatch.chdir(tmp_path)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            data = {"topic": "Космос", "slide_count": 2, "output_path": "Доклад.pptx", "use_cache": False}
+            return await client.post("/generate-from-topic/", data={"request": json.dumps(data)})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == "attachment; filename*=utf-8''%D0%94%D0%BE%D0%BA%D0%BB%D0%B0%D0%B4.pptx"
+    assert int(response.headers["x-presentation-size"]) == len(response.content)
+    assert list(tmp_path.rglob("*.pptx")) == []
+    assert list((tmp_path / "uploads").iterdir()) == []
@@ -20,9 +20,9 @@ def test_generate_from_topic_normal():
     response = client.post("/generate-from-topic/", data={"request": json.dumps(data)})
     assert response.status_code == 200
     assert response.headers["content-type"] == "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-    assert os.path.exists("test_output_normal.pptx")
-    if os.path.exists("test_output_normal.pptx"):
-        os.remove("test_output_normal.pptx")
+    assert 'filename="test_output_normal.pptx"' in response.headers["content-disposition"]
+    assert response.content[:2] == b"PK"
+    assert not os.path.exists("test_output_normal.pptx")
 
 def test_generate_from_topic_template():
     data = {
@@ -34,9 +34,9 @@ def test_generate_from_topic_template():
     response = client.post("/generate-from-topic/", data={"request": json.dumps(data)})
     assert response.status_code == 200
     assert response.headers["content-type"] == "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-    assert os.path.exists("test_output_template.pptx")
-    if os.path.exists("test_output_template.pptx"):
-        os.remove("test_output_template.pptx")
+    assert 'filename="test_output_template.pptx"' in response.headers["content-disposition"]
+    assert response.content[:2] == b"PK"
+    assert not os.path.exists("test_output_template.pptx")
 
 def test_generate_from_topic_template_invalid_slide_count():
     data = {
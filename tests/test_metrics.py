@@ -0,0 +1,49 @@
+import json
+from fastapi.testclient import TestClient
+from generate_presentation import main, metrics
+from generate_presentation.metrics import Histogram, server_timing_header, span
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Тест", ("stage",), buckets=(0.1, 1))
+    histogram.observe(0.05, "llm")
+    histogram.observe(0.5, "llm")
+    histogram.observe(5, "llm")
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="llm",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="llm"} 3' in lines
+
+def test_span_records_request_timings():
+    timings = metrics.start_request_timings()
+    with span("images"):
+        pass
+    with span("images"):
+        pass
+    assert [stage for stage, _ in timings] == ["images", "images"]
+    assert server_timing_header(timings).startswith("images;dur=")
+    assert 'desc="x2"' in server_timing_header(timings)
+
+def test_generate_reports_server_timing_and_metrics(monkeypatch):
+    async def fake_llama_json_async(text, system_prompt="The output is in JSON format"):
+        return [{"zagolovok": "Слайд 1", "opisanie": "Описание 1"}]
+
+    async def fake_generate_images(descriptions, scratch, on_complete=None, **kwargs):
+        return [None for _ in descriptions]
+
+    monkeypatch.setattr(main.llm, "llama_json_async", fake_llama_json_async)
+    monkeypatch.setattr(main.image_client, "generate_images", fake_generate_images)
+
+    client = TestClient(main.app)
+    data = {"topic": "Метрики", "slide_count": 2, "use_cache": False}
+    response = client.post("/generate-from-topic/", data={"request": json.dumps(data)})
+    assert response.status_code == 200
+    server_timing = response.headers["server-timing"]
+    for stage in ("validation", "images", "assembly", "slide_build", "pptx_save", "total"):
+        assert f"{stage};dur=" in server_timing
+
+    exposition = client.get("/metrics").text
+    assert 'presentation_stage_seconds_count{stage="pptx_save"}' in exposition
+    assert 'presentation_http_requests_total{path="/generate-from-topic/",status="200"}' in exposition
+    assert 'presentation_payload_bytes_count{kind="deck"}' in exposition
+    assert "presentation_job_queue_depth 0" in exposition
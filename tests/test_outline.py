@@ -0,0 +1,70 @@
+import asyncio
+import json
+from fastapi.testclient import TestClient
+from generate_presentation import main
+from generate_presentation.outline import OUTLINE_SYSTEM_PROMPT, generate_outline_slides
+
+class FakeLLM:
+    model = "fake"
+
+    def __init__(self, broken_slides=(), broken_attempts=1):
+        self.broken_slides = set(broken_slides)
+        self.broken_attempts = broken_attempts
+        self.slide_calls = {}
+        self.active = 0
+        self.peak = 0
+
+    async def llama_json_async(self, text, system_prompt="The output is in JSON format"):
+        if system_prompt == OUTLINE_SYSTEM_PROMPT:
+            return {"titles": ["Введение", "История", "Будущее"]}
+        title = text.split("Напиши описание слайда ")[1].split(" ")[0]
+        index = int(title)
+        self.slide_calls[index] = self.slide_calls.get(index, 0) + 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.05)
+        self.active -= 1
+        if index in self.broken_slides and self.slide_calls[index] <= self.broken_attempts:
+            return {"tool": "unknown", "args": {"text": text}}
+        return {"opisanie": f"Описание слайда {index}"}
+
+def test_slides_are_written_concurrently():
+    llm = FakeLLM()
+    slides = asyncio.run(generate_outline_slides(llm, "Космос", 3))
+    assert [slide["zagolovok"] for slide in slides] == ["Введение", "История", "Будущее"]
+    assert slides[2]["opisanie"] == "Описание слайда 3"
+    assert llm.peak == 3
+
+def test_only_failed_slides_are_retried():
+    llm = FakeLLM(broken_slides={2})
+    slides = asyncio.run(generate_outline_slides(llm, "Космос", 3))
+    assert slides[1]["opisanie"] == "Описание слайда 2"
+    assert llm.slide_calls == {1: 1, 2: 2, 3: 1}
+
+def test_slide_failing_all_retries_fails_generation():
+    llm = FakeLLM(broken_slides={3}, broken_attempts=10)
+    try:
+        asyncio.run(generate_outline_slides(llm, "Космос", 3, retries=1))
+    except ValueError as e:
+        assert "[3]" in str(e)
+    else:
+        raise AssertionError("ожидалась ошибка")
+    assert llm.slide_calls[3] == 2
+
+def test_outline_mode_endpoint(monkeypatch):
+    fake = FakeLLM()
+    described = []
+
+    async def fake_generate_image(description, slide_index, *args, **kwargs):
+        described.append(description)
+        return None
+
+    monkeypatch.setattr(main, "llm", fake)
+    monkeypatch.setattr(main.image_client, "generate_image", fake_generate_image)
+
+    client = TestClient(main.app)
+    data = {"topic": "Космос", "slide_count": 4, "outline_mode": True, "use_cache": False}
+    response = client.post("/generate-from-topic/", data={"request": json.dumps(data)})
+    assert response.status_code == 200
+    assert response.content[:2] == b"PK"
+    assert sorted(described) == ["Описание слайда 1", "Описание слайда 2", "Описание слайда 3"]
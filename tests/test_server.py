@@ -0,0 +1,70 @@
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from fastapi.testclient import TestClient
+from generate_presentation import main
+from generate_presentation.jobs import FileJobBackend
+from generate_presentation.models import JobInfo, JobStatus
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_lifespan_starts_and_stops_background_tasks():
+    with TestClient(main.app) as client:
+        assert len(main.background_tasks) == 3
+        assert main.UPLOAD_DIR.exists()
+        stats = client.get("/server/stats").json()
+        assert stats["pid"] == os.getpid()
+        assert stats["startup_seconds"] > 0
+        assert stats["memory"]["rss"] > 0
+    assert main.background_tasks == []
+
+def test_file_job_backend_is_shared_and_ordered(tmp_path):
+    owner = FileJobBackend(tmp_path)
+    other = FileJobBackend(tmp_path)
+    job = JobInfo(job_id="abc", status=JobStatus.running, created_at=1.0, updated_at=2.0)
+    stale = job.model_copy(update={"status": JobStatus.queued, "updated_at": 1.0})
+
+    async def run():
+        await owner.save(job)
+        await owner.save(stale)
+        seen = await other.get("abc")
+        job.status, job.updated_at, job.expires_at = JobStatus.done, 3.0, 5.0
+        await owner.save(job)
+        expired = await other.expired(10.0)
+        await other.delete("abc")
+        return seen, expired, await owner.get("abc")
+
+    seen, expired, deleted = asyncio.run(run())
+    assert seen.status == JobStatus.running
+    assert [item.job_id for item in expired] == ["abc"]
+    assert deleted is None
+
+def test_server_runs_preforked_workers(tmp_path):
+    port = free_port()
+    env = {**os.environ, "JOB_STATE_DIR": str(tmp_path / "jobs"), "JOB_RESULTS_DIR": str(tmp_path / "results")}
+    process = subprocess.Popen([sys.executable, "-m", "generate_presentation.server", "--workers", "2", "--port", str(port)], env=env)
+    try:
+        pids = set()
+        deadline = time.time() + 30
+        while len(pids) < 2 and time.time() < deadline:
+            try:
+                # Новое соединение на каждый запрос, чтобы его мог принять любой обработчик
+                stats = httpx.get(f"http://127.0.0.1:{port}/server/stats").json()
+                pids.add(stats["pid"])
+                # Обработчик ответвляется от предзагруженного процесса и стартует без повторного импорта
+                assert stats["startup_seconds"] < 5
+            except httpx.TransportError:
+                time.sleep(0.1)
+        assert len(pids) == 2
+        assert process.pid not in pids
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=20) == 0
@@ -0,0 +1,67 @@
+import asyncio
+import json
+from fastapi.testclient import TestClient
+from generate_presentation import main
+from generate_presentation.cache import TieredCache
+from generate_presentation.streaming import SlideStreamParser
+
+def test_parser_emits_slides_as_they_complete():
+    text = json.dumps({"slides": [
+        {"zagolovok": "Слайд {1}", "opisanie": "Текст с \"кавычками\" и }скобками{"},
+        {"zagolovok": "Слайд 2", "opisanie": "Описание 2"},
+    ]}, ensure_ascii=False)
+    parser = SlideStreamParser()
+    emitted = []
+    for i in range(0, len(text), 7):
+        emitted.append(parser.feed(text[i:i + 7]))
+    slides = [slide for chunk in emitted for slide in chunk]
+    assert [slide["zagolovok"] for slide in slides] == ["Слайд {1}", "Слайд 2"]
+    first_chunk = next(i for i, chunk in enumerate(emitted) if chunk)
+    assert first_chunk < len(emitted) - 1
+
+def test_parser_ignores_objects_without_slide_fields():
+    parser = SlideStreamParser()
+    assert parser.feed('[{"foo": 1}, {"zagolovok": "A", "opisanie": "B"}]') == [{"zagolovok": "A", "opisanie": "B"}]
+
+def test_stream_mode_starts_images_before_llm_finishes(monkeypatch, tmp_path):
+    events = []
+
+    async def fake_llama_generator(text, temperature=0.7, system_prompt="", **kwargs):
+        for i in range(3):
+            await asyncio.sleep(0.05)
+            yield json.dumps({"zagolovok": f"Слайд {i}", "opisanie": f"Описание {i}"}, ensure_ascii=False) + ","
+        events.append("llm_done")
+
+    async def fake_generate_image(description, slide_index, *args, **kwargs):
+        events.append(f"image_{slide_index}")
+        return None
+
+    monkeypatch.setattr(main.llm, "llama_generator", fake_llama_generator)
+    monkeypatch.setattr(main.image_client, "generate_image", fake_generate_image)
+
+    data = {"topic": "Космос", "slide_count": 4, "output_path": str(tmp_path / "stream.pptx"), "stream_mode": True, "use_cache": False}
+    response = TestClient(main.app).post("/generate-from-topic/", data={"request": json.dumps(data)})
+    assert response.status_code == 200
+    assert events.index("image_0") < events.index("llm_done")
+    assert sorted(e for e in events if e.startswith("image_")) == ["image_0", "image_1", "image_2"]
+
+def test_truncated_stream_fails_and_is_not_cached(monkeypatch):
+    async def fake_llama_generator(text, temperature=0.7, system_prompt="", **kwargs):
+        yield json.dumps({"zagolovok": "Слайд 1", "opisanie": "Описание 1"}, ensure_ascii=False) + ","
+        raise ConnectionError("соединение разорвано")
+
+    async def short_llama_generator(text, temperature=0.7, system_prompt="", **kwargs):
+        yield json.dumps({"zagolovok": "Слайд 1", "opisanie": "Описание 1"}, ensure_ascii=False)
+
+    async def fake_generate_image(description, slide_index, *args, **kwargs):
+        return None
+
+    monkeypatch.setattr(main, "slide_cache", TieredCache("test"))
+    monkeypatch.setattr(main.image_client, "generate_image", fake_generate_image)
+    client = TestClient(main.app)
+    data = {"topic": "Космос", "slide_count": 6, "stream_mode": True}
+    for generator in (fake_llama_generator, short_llama_generator):
+        monkeypatch.setattr(main.llm, "llama_generator", generator)
+        response = client.post("/generate-from-topic/", data={"request": json.dumps(data)})
+        assert response.status_code == 500
+    assert main.slide_cache.stats()["sets"] == 0
@@ -0,0 +1,49 @@
+import json
+from pathlib import Path
+from fastapi.testclient import TestClient
+from pptx import Presentation
+from generate_presentation import main
+from generate_presentation.presentation_generator import generate_presentation
+from generate_presentation.template_registry import TEMPLATES_DIR, TemplateRegistry
+
+def test_registry_precomputes_placeholders():
+    registry = TemplateRegistry(Path("templates"))
+    info = registry.get("template")
+    assert registry.names() == ["template"]
+    assert info.body_idx is not None
+    assert info.picture_idx is not None
+    assert info.picture_size is not None
+
+def test_open_returns_independent_copy():
+    registry = TemplateRegistry(Path("templates"))
+    prs, info = registry.open("template")
+    prs.slides[0].shapes.title.text = "Изменено"
+    again, _ = registry.open("template")
+    assert again.slides[0].shapes.title.text != "Изменено"
+    assert len(again.slides) == info.slide_count
+
+def test_template_mode_fills_placeholders(tmp_path):
+    output_path = tmp_path / "template.pptx"
+    data = [{"zagolovok": "Слайд 1", "opisanie": "Описание 1"}, {"zagolovok": "Слайд 2", "opisanie": "Описание 2"}]
+    generate_presentation(data, 4, str(output_path), "Космос", template_mode=True)
+    prs = Presentation(str(output_path))
+    texts = [shape.text_frame.text for slide in prs.slides for shape in slide.shapes if shape.has_text_frame]
+    assert "Космос" in texts
+    assert "\nОписание 2" in texts
+
+def test_unknown_template_rejected():
+    data = {"topic": "Космос", "slide_count": 4, "template_mode": True, "template_name": "missing"}
+    response = TestClient(main.app).post("/generate-from-topic/", data={"request": json.dumps(data)})
+    assert response.status_code == 422
+    assert "missing" in response.json()["detail"]
+
+def test_default_directory_does_not_depend_on_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert TemplateRegistry(TEMPLATES_DIR).names() == ["template"]
+
+def test_preload_warns_without_templates(tmp_path, monkeypatch):
+    messages = []
+    monkeypatch.setattr(main, "template_registry", TemplateRegistry(tmp_path))
+    monkeypatch.setattr(main.logger, "warning", messages.append)
+    main.preload()
+    assert messages and str(tmp_path) in messages[0]